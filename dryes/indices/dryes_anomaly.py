@@ -19,6 +19,19 @@ class DRYESAnomaly(DRYESIndex):
         'type'   : 'empiricalzscore'
     }
     
+    def __init__(self, *args, **kwargs):
+        # running sums over the history for each (input data, month, day), see calc_parameters
+        self._history_sums = {}
+        super().__init__(*args, **kwargs)
+
+    def compute(self, *args, **kwargs) -> None:
+        # the running sums are only reused within a single run, the input data can change between runs
+        self._history_sums = {}
+        try:
+            super().compute(*args, **kwargs)
+        finally:
+            self._history_sums = {}
+
     @property
     def parameters(self):
         opt_cases = self.cases['opt']
@@ -45,23 +58,59 @@ class DRYESAnomaly(DRYESIndex):
         all_dates  = [datetime(year, time.month, time.day) for year in history_years]
         data_dates = [date for date in all_dates if date >= history.start and date <= history.end]
 
-        data_ = [variable.get_data(time) for time in data_dates]
-        data = np.stack(data_, axis = 0)
+        years = frozenset(date.year for date in data_dates)
+
+        # the reference periods of consecutive timesteps overlap by most of their years:
+        # we keep the count, sum and sum of squares of the valid values for each (input data, month, day)
+        # and only add the years that entered the history and remove the ones that left it.
+        # The values are summed as deviations from a shift (the mean of the history when the sums were started),
+        # so that the variance is not the difference of two large, nearly equal numbers (sum_sq / count - mean**2)
+        # the modification time of the data for each year is stored too, if the data of any year in the sums
+        # has changed since, the sums are computed from scratch
+        key = (variable.path_pattern, time.month, time.day)
+        old_mtimes, sums = self._history_sums.get(key, ({}, None))
+        old_years = frozenset(old_mtimes)
+        mtimes = {year: variable.get_mtime(datetime(year, time.month, time.day)) for year in years | old_years}
+        to_add, to_remove = years - old_years, old_years - years
+        changed = any(old_mtimes[year] != mtimes[year] for year in old_years)
+        if sums is None or changed or len(to_add) + len(to_remove) >= len(years):
+            data = np.stack([np.asarray(variable.get_data(datetime(year, time.month, time.day))) for year in sorted(years)], axis = 0)
+            with warnings.catch_warnings():
+                warnings.simplefilter("ignore", category=RuntimeWarning)
+                shift = np.nan_to_num(np.nanmean(data, axis = 0, dtype = np.float64))
+            valid = ~np.isnan(data)
+            deviations = np.where(valid, data - shift, 0)
+            sums = (valid.sum(axis = 0), deviations.sum(axis = 0), (deviations**2).sum(axis = 0), shift, data.dtype)
+            del data, valid, deviations
+            to_add, to_remove = frozenset(), frozenset()
+
+        for sign, these_years in [(1, to_add), (-1, to_remove)]:
+            for year in sorted(these_years):
+                count, sum_, sum_sq, shift, dtype = sums
+                data = np.asarray(variable.get_data(datetime(year, time.month, time.day)))
+                valid = ~np.isnan(data)
+                deviations = np.where(valid, data - shift, 0)
+                sums = (count + sign * valid, sum_ + sign * deviations, sum_sq + sign * deviations**2, shift, dtype)
+        self._history_sums[key] = ({year: mtimes[year] for year in years}, sums)
+        count, sum_, sum_sq, shift, dtype = sums
 
         output = {}
         # calculate the parameters
         parameters = par_and_cases.keys()
-        # we are using a warning catcher here because np.nanmean and np.nanstd will throw a warning if all values are NaN
+        # the output types are the same as np.nanmean and np.nanstd on the stacked data
+        out_dtype = np.nanmean(np.zeros(1, dtype = dtype)).dtype
+        # we are using a warning catcher here because the mean and std are NaN (0/0) where all values are NaN
         with warnings.catch_warnings():
             warnings.simplefilter("ignore", category=RuntimeWarning)
+            mean_deviation = sum_ / count
+            mean_data = shift + mean_deviation
             # mean
             if 'mean' in parameters:
-                mean_data = np.nanmean(data, axis = 0)
-                output['mean'] = {0:mean_data} # -> we save this as case 0 because it is the same for all cases
+                output['mean'] = {0:mean_data.astype(out_dtype)} # -> we save this as case 0 because it is the same for all cases
             # std
             if 'std' in parameters:
-                std_data = np.nanstd(data, axis = 0)
-                output['std'] = {0:std_data} # -> we save this as case 0 because it is the same for all cases
+                std_data = np.sqrt(np.maximum(sum_sq / count - mean_deviation**2, 0))
+                output['std'] = {0:std_data.astype(out_dtype)} # -> we save this as case 0 because it is the same for all cases
         return output
     
     def calc_index(self, time,  history: TimeRange, case: dict) -> xr.DataArray:
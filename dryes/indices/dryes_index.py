@@ -1,7 +1,11 @@
 from datetime import datetime
-from typing import Callable, List, Iterable
+import itertools
+import functools
+import heapq
+from collections import deque
+from typing import Callable, List, Iterable, Optional
+from concurrent.futures import ThreadPoolExecutor, as_completed
 import xarray as xr
-from copy import deepcopy
 
 from ..time_aggregation.time_aggregation import TimeAggregation
 from ..io import IOHandler
@@ -11,6 +15,14 @@ from ..utils.time import TimeRange, create_timesteps, ntimesteps_to_md
 from ..utils.parse import options_to_cases
 
 class DRYESIndex:
+    # number of threads for the steps that can run in parallel (None: use the concurrent.futures default)
+    max_workers: Optional[int] = None
+    # whether the reference period is the same for all timesteps (set in compute)
+    _static_reference: bool = False
+    # whether calc_index only depends on the timestep and case it is called for, so that the index
+    # for all (case, timestep) pairs can be computed in parallel (see make_index)
+    parallel_index: bool = True
+
     def __init__(self,
                  index_options: dict,
                  io_options: dict) -> None:
@@ -96,7 +108,7 @@ class DRYESIndex:
         ## finally add the post-processing, if it exists
         post_cases = []
         if post_processing is not None:
-            for post_name, post_fn in post_processing.items():
+            for i, (post_name, post_fn) in enumerate(post_processing.items()):
                 this_case = dict()
                 this_case['id']   = i
                 this_case['name'] = post_name
@@ -151,12 +163,17 @@ class DRYESIndex:
         
         # turn the current period into a TimeRange object
         current = TimeRange(current[0], current[1])
-        raw_reference = deepcopy(reference)
         # make the reference period a function of time, for extra flexibility
+        # (if it is fixed, reference_fn only needs to be evaluated once)
+        self._static_reference = isinstance(reference, tuple) or isinstance(reference, list)
         if isinstance(reference, tuple) or isinstance(reference, list):
-            reference_fn = lambda time: TimeRange(raw_reference[0], raw_reference[1])
+            # the TimeRange is built here once, so that changes to the original list do not affect the reference
+            reference_range = TimeRange(reference[0], reference[1])
+            reference_fn = lambda time: reference_range
         elif isinstance(reference, Callable):
-            reference_fn = lambda time: TimeRange(raw_reference(time)[0], raw_reference(time)[1])
+            # the same timesteps are passed to reference_fn by make_data_timesteps, make_reference_periods
+            # and make_index, we only build the TimeRange once for each
+            reference_fn = functools.lru_cache(maxsize=4096)(lambda time: TimeRange(*reference(time)[:2]))
 
         # get the timesteps for which we need input data
         if len(self.cases['agg']) == 0:
@@ -189,18 +206,19 @@ class DRYESIndex:
 
         # all of this will get the range for the data that is needed
         current_timesteps = create_timesteps(current.start, current.end, timesteps_per_year)
-        reference_start = set(reference_fn(time).start for time in current_timesteps)
-        reference_end   = set(reference_fn(time).end   for time in current_timesteps)
+        reference_times = current_timesteps[:1] if self._static_reference else current_timesteps
+        references = [reference_fn(time) for time in reference_times]
+        reference_start = set(reference.start for reference in references)
+        reference_end   = set(reference.end   for reference in references)
         if self.iscontinuous:
             time_start = min(reference_start)
-            time_end   = max(current_timesteps)
+            time_end   = current_timesteps[-1]
             return create_timesteps(time_start, time_end, timesteps_per_year)
         else:
             reference_timesteps = create_timesteps(min(reference_start), max(reference_end), timesteps_per_year)
-            all_timesteps = set.union(set(reference_timesteps), set(current_timesteps))
-            all_timesteps = list(all_timesteps)
-            all_timesteps.sort()
-            return all_timesteps
+            # both are sorted already: merge them and drop the duplicates (which are adjacent)
+            all_timesteps = heapq.merge(reference_timesteps, current_timesteps)
+            return [time for time, _ in itertools.groupby(all_timesteps)]
 
     def make_reference_periods(self, current_timesteps: Iterable[datetime],
                                reference_fn: Callable[[datetime], TimeRange]) -> List[TimeRange]:
@@ -208,16 +226,16 @@ class DRYESIndex:
         This function will return the reference periods for which the parameters need to be computed.
         """
 
-        references = set()
-        for time in current_timesteps:
+        # keep the first TimeRange for each unique (start, end), rather than building new ones
+        references = {}
+        reference_times = list(current_timesteps)[:1] if self._static_reference else current_timesteps
+        for time in reference_times:
             this_reference = reference_fn(time)
-            references.add((this_reference.start, this_reference.end))
-        
-        references = list(references)
-        references.sort()
+            references.setdefault((this_reference.start, this_reference.end), this_reference)
 
-        references_as_tr = [TimeRange(start, end) for start, end in references]
-        return references_as_tr
+        # there is only a handful of unique references, sorting them is cheap
+        # and does not rely on reference_fn being monotonic in time
+        return [references[key] for key in sorted(references)]
     
     def make_input_data(self, timesteps: List[datetime]):# -> dict[str:str]:
         """
@@ -237,52 +255,83 @@ class DRYESIndex:
         agg_names = [case['name'] for case in agg_cases]
 
         # check what timesteps have already been computed for each aggregation
-        timesteps_to_compute = {agg_name:[] for agg_name in agg_names}
-        time_range = TimeRange(min(timesteps), max(timesteps))
+        time_range = TimeRange(timesteps[0], timesteps[-1])
+        all_ts = frozenset(timesteps)
+        timesteps_to_compute = {}
         for agg_name in agg_names:
-            available_ts = variable_out.get_times(time_range, agg_fn = agg_name)
+            available_ts = frozenset(variable_out.get_times(time_range, agg_fn = agg_name))
 
             # if there is no post aggregation function, we don't care for the order of the timesteps
-            # and can just compute the missing ones
+            # and can just compute the missing ones (a set difference on the datetimes: converting them to datetime64
+            # for np.isin costs much more than the membership tests it replaces)
             if agg_name not in time_agg.postaggfun.keys():
-                these_ts_to_compute = [time for time in timesteps if time not in available_ts]
+                timesteps_to_compute[agg_name] = sorted(all_ts.difference(available_ts))
             # if there is a post aggregation function, each timesteps depends on the previous one(s)
             # so we need to compute them in order TODO: check if this works as expected
+            # (timesteps is sorted, so this is the prefix before the first available timestep)
             else:
-                these_ts_to_compute = []
-                i = 0
-                while(timesteps[i] not in available_ts) and i < len(timesteps):
-                    these_ts_to_compute.append(timesteps[i])
-                    i += 1
-            timesteps_to_compute[agg_name] = these_ts_to_compute
-
-        timesteps_to_iterate = set.union(*[set(timesteps_to_compute[agg_name]) for agg_name in agg_names])
-        timesteps_to_iterate = list(timesteps_to_iterate)
-        timesteps_to_iterate.sort()
-
-        if len(timesteps_to_iterate) > 0:
+                timesteps_to_compute[agg_name] = list(itertools.takewhile(lambda time: time not in available_ts, timesteps))
+
+        if any(len(ts) > 0 for ts in timesteps_to_compute.values()):
             self.log.info(f'Aggregating input data ({variable_in.name})...')
 
-        agg_data = {n:[] for n in agg_names if agg_name in time_agg.postaggfun.keys()}
-        for i, time in enumerate(timesteps_to_iterate):
-            self.log.info(f' #Timestep {time:%d-%m-%Y} ({i+1}/{len(timesteps_to_iterate)})...')
-            for agg_name in agg_names:
-                self.log.info(f'  Aggregation {agg_name}...')
-                if time in timesteps_to_compute[agg_name]:
-                    data = time_agg.aggfun[agg_name](variable_in, time)
-                    if agg_name not in time_agg.postaggfun.keys():
-                        variable_out.write_data(data, time = time, agg_fn = agg_name)
+        # go through the timesteps in order, with all the aggregations of each timestep one after the other,
+        # so that they share the (cached) reads of the input data: the reads can't run in parallel anyway
+        # (rasterio reads are serialised by a global lock). This is why the aggregations are not computed in a thread pool:
+        # a pool splits the timesteps that share their inputs and reads them more than once, for no parallel gain
+        ts_sets = {agg_name: frozenset(timesteps_to_compute[agg_name]) for agg_name in agg_names}
+        timesteps_to_iterate = sorted(frozenset().union(*ts_sets.values()))
+
+        # aggregations that can slide over the data (e.g. sums and averages over a window) are generators over
+        # all their timesteps, reading each input only once: we advance them together, one timestep at a time
+        rolling = {agg_name: time_agg.aggfun[agg_name].rolling(variable_in, timesteps_to_compute[agg_name])
+                   for agg_name in agg_names if agg_name not in time_agg.postaggfun.keys()
+                   and hasattr(time_agg.aggfun[agg_name], 'rolling')}
+
+        # aggregations with a post aggregation function depend on the order of the timesteps,
+        # we keep them as (time, data) pairs, the others are written as soon as they are computed
+        agg_data = {agg_name: [] for agg_name in agg_names if agg_name in time_agg.postaggfun.keys()}
+
+        # the writes go to a single writer thread, so that writing a timestep overlaps with aggregating the next one
+        # (one writer: the writes stay in order, which a zarr store needs). We wait for the oldest write when more
+        # than a timestep's worth is queued, so that the aggregated data does not pile up in memory
+        max_queued = len(agg_names)
+        with ThreadPoolExecutor(max_workers = 1) as writer:
+            writes = deque()
+            for i, time in enumerate(timesteps_to_iterate):
+                self.log.info(f' #Timestep {time:%d-%m-%Y} ({i+1}/{len(timesteps_to_iterate)})...')
+                for agg_name in agg_names:
+                    if time not in ts_sets[agg_name]: continue
+                    self.log.info(f'  Aggregation {agg_name}...')
+                    if agg_name in rolling:
+                        # the rolling aggregations yield their (sorted) timesteps in the same order
+                        _, data = next(rolling[agg_name])
                     else:
-                        agg_data[agg_name].append(data)
-        
-        for agg_name in agg_names:
-            if agg_name in time_agg.postaggfun.keys():
-                self.log.info(f'Completing time aggregation: {agg_name}...')
-                agg_data[agg_name] = time_agg.postaggfun[agg_name](agg_data[agg_name], variable_in)
-
-                for i, data in enumerate(agg_data[agg_name]):
-                    this_time = timesteps_to_compute[agg_name][i]
-                    variable_out.write_data(data, time = this_time, agg_fn = agg_name)
+                        data = time_agg.aggfun[agg_name](variable_in, time)
+                    if agg_name in agg_data:
+                        agg_data[agg_name].append((time, data))
+                    else:
+                        writes.append(writer.submit(variable_out.write_data, data, time = time, agg_fn = agg_name))
+                        while len(writes) > max_queued:
+                            writes.popleft().result()
+            # raise any error from the writes still queued
+            while len(writes) > 0:
+                writes.popleft().result()
+        del rolling
+
+        # the post aggregation needs the whole sequence: we release each buffer as soon as it has been written
+        for agg_name in list(agg_data.keys()):
+            this_agg_data = agg_data.pop(agg_name)
+            self.log.info(f'Completing time aggregation: {agg_name} ({len(this_agg_data)} timesteps)...')
+            times = [time for time, _ in this_agg_data]
+            data  = [data for _, data in this_agg_data]
+            del this_agg_data
+            # the post aggregation function returns the data in the same order as it receives it
+            post_data = time_agg.postaggfun[agg_name](data, variable_in)
+            del data
+
+            variable_out.write_batch(post_data, times, agg_fn = agg_name)
+            del post_data
     
     def make_parameters(self,
                         history: TimeRange,
@@ -327,10 +376,12 @@ class DRYESIndex:
             
             # check timesteps that have already been calculated for each parameter
             timesteps_to_do = {}
+            time_range = TimeRange(timesteps[0], timesteps[-1])
+            all_ts = frozenset(timesteps)
             for parname, par in parameters.items():
                 for case in self.cases['opt']:
-                    this_ts_done = par.get_times(TimeRange(min(timesteps), max(timesteps)), **case['tags'])
-                    this_ts_todo = [time for time in timesteps if time not in this_ts_done]
+                    # in incremental runs everything is usually done already, and this is empty
+                    this_ts_todo = sorted(all_ts.difference(par.get_times(time_range, **case['tags'])))
                     for ts in this_ts_todo:
                         if ts not in timesteps_to_do:
                             timesteps_to_do[ts] = {}
@@ -341,68 +392,110 @@ class DRYESIndex:
             # if nothing needs to be calculated, skip
             if len(timesteps_to_do) == 0: return
             self.log.info(f'  -Iterating through {len(timesteps_to_do)} timesteps with missing parameters.')
-            for time, par_cases in timesteps_to_do.items():
-                month = time.month
-                day   = time.day
-                self.log.info(f'   {day:02d}/{month:02d}')
-
-                pars_data = self.calc_parameters(time, variable, history, par_cases)
-
-                for parname in pars_data:
-                    par = parameters[parname]
-                    for case, data in pars_data[parname].items():
-                        tags = self.cases['opt'][case]['tags']
-                        par.write_data(data, time = time, time_format = '%d/%m', **tags)
+            # each (month, day) only depends on the history for that day, we compute them in parallel
+            # and write them (from this thread) as soon as they are done, unless the output can take
+            # all the timesteps in one go (see IOHandler.supports_batch_write), then we collect them first
+            pars_out = {}
+            with ThreadPoolExecutor(max_workers = self.max_workers) as pool:
+                futures = {pool.submit(self.calc_parameters, time, variable, history, par_cases): time
+                           for time, par_cases in timesteps_to_do.items()}
+                for future in as_completed(futures):
+                    # drop the future, so that its result is released once it has been used
+                    time = futures.pop(future)
+                    self.log.info(f'   {time.day:02d}/{time.month:02d}')
+                    pars_data = future.result()
+
+                    for parname in pars_data:
+                        par = parameters[parname]
+                        for case, data in pars_data[parname].items():
+                            tags = self.cases['opt'][case]['tags']
+                            if par.supports_batch_write(**tags):
+                                pars_out.setdefault((parname, case), []).append((time, data))
+                            else:
+                                par.write_data(data, time = time, time_format = '%d/%m', **tags)
+
+            for (parname, case), this_par_out in pars_out.items():
+                this_par_out.sort(key = lambda x: x[0])
+                tags = self.cases['opt'][case]['tags']
+                parameters[parname].write_batch([data for _, data in this_par_out],
+                                                [time for time, _ in this_par_out],
+                                                time_format = '%d/%m', **tags)
 
     def make_index(self, timesteps: List[datetime], reference_fn: Callable[[datetime], TimeRange]) -> str:
-        self.log.info(f'Calculating index for {min(timesteps):%d/%m/%Y}-{max(timesteps):%d/%m/%Y}...')
+        self.log.info(f'Calculating index for {timesteps[0]:%d/%m/%Y}-{timesteps[-1]:%d/%m/%Y}...')
 
         # check if anything has been calculated already
         agg_cases = self.cases['agg'] if len(self.cases['agg']) > 0 else [{}]
-        for agg in agg_cases:
+        time_range = TimeRange(timesteps[0], timesteps[-1])
+        all_ts = frozenset(timesteps)
+        index_cases = []
+        for agg, case_ in itertools.product(agg_cases, self.cases['opt']):
             agg_tags = agg['tags'] if 'tags' in agg else {}
             agg_name = agg['name'] if 'name' in agg else ''
 
-            for case_ in self.cases['opt']:
-                case = case_.copy()
-                case['tags'].update(agg_tags)
-                case['tags']['post_fn'] = ""
-                index = self._index.update(**case['tags'])
+            # the tags are merged in a new dictionary, so that the cases in self.cases are not modified
+            case = case_.copy()
+            case['tags'] = {**case_['tags'], **agg_tags, 'post_fn': ""}
+            index = self._index.update(**case['tags'])
 
-                case['name'] = case['name'] if len(agg_name) == 0 else ', '.join([f'Aggregation {agg_name}', case['name']])
+            case['name'] = case['name'] if len(agg_name) == 0 else ', '.join([f'Aggregation {agg_name}', case['name']])
 
-                ts_done = index.get_times(TimeRange(min(timesteps), max(timesteps)))
-                ts_todo = [time for time in timesteps if time not in ts_done]
+            ts_todo = sorted(all_ts.difference(index.get_times(time_range)))
 
-                if len(ts_todo) == 0:
-                    self.log.info(f' #Case {case["name"]}: already calculated.')
-                else:        
-                    self.log.info(f' #Case {case["name"]}: {len(timesteps) - len(ts_todo)}/{len(timesteps)} timesteps already computed.')
-                    for time in ts_todo:
-                        self.log.info(f'   {time:%d/%m/%Y}')
-                        history = reference_fn(time)
-                        case['tags'].update({'history_start': history.start, 'history_end': history.end})
-                        index_data = self.calc_index(time, history, case)
-                        index.write_data(index_data, time = time)
-
-                # now do the post-processing
-                for post_case in self.cases['post']:
-                    case['tags'].update(post_case['tags'])
-                    ppindex = self._index.update(**case['tags'])
-                    ts_done = ppindex.get_times(TimeRange(min(timesteps), max(timesteps)))
-                    ts_todo = [time for time in timesteps if time not in ts_done]
-                    if len(ts_todo) == 0:
-                        self.log.info(f'  Post-processing {post_case["name"]}: already calculated.')
-                        continue
-                    self.log.info(f'  Post-processing {post_case["name"]}: {len(timesteps) - len(ts_todo)}/{len(timesteps)} timesteps already computed.')
+            if len(ts_todo) == 0:
+                self.log.info(f' #Case {case["name"]}: already calculated.')
+            else:
+                self.log.info(f' #Case {case["name"]}: {len(timesteps) - len(ts_todo)}/{len(timesteps)} timesteps already computed.')
+            index_cases.append((case, index, ts_todo))
+
+        # each task gets its own copy of the tags, with the history for that timestep
+        def with_history(case, time):
+            history = reference_fn(time)
+            return history, {**case, 'tags': {**case['tags'], 'history_start': history.start, 'history_end': history.end}}
+
+        if self.parallel_index:
+            # all (case, timestep) pairs are independent: we compute them in parallel
+            # and write them (from this thread) as soon as they are done
+            with ThreadPoolExecutor(max_workers = self.max_workers) as pool:
+                futures = {}
+                for case, index, ts_todo in index_cases:
                     for time in ts_todo:
-                        self.log.info(f'   {time:%d/%m/%Y}')
-                        history = reference_fn(time)
-                        case['tags'].update({'history_start': history.start, 'history_end': history.end})
-                        index_data = index.get_data(time)
-                        post_fn = post_case['post_fn']
-                        ppindex_data = post_fn(index_data)
-                        ppindex.write_data(ppindex_data, time = time)
+                        history, this_case = with_history(case, time)
+                        futures[pool.submit(self.calc_index, time, history, this_case)] = (case, index, time)
+                n_tasks = len(futures)
+                for i, future in enumerate(as_completed(futures)):
+                    # drop the future once written, so that the data is not kept until the end
+                    case, index, time = futures.pop(future)
+                    self.log.info(f'   {case["name"]}: {time:%d/%m/%Y} ({i+1}/{n_tasks})')
+                    index.write_data(future.result(), time = time)
+        else:
+            # each timestep depends on the previous ones, the cases are done one at a time, in order
+            for case, index, ts_todo in index_cases:
+                self.log.info(f' #Case {case["name"]}:')
+                for time in ts_todo:
+                    self.log.info(f'   {time:%d/%m/%Y}')
+                    history, this_case = with_history(case, time)
+                    index_data = self.calc_index(time, history, this_case)
+                    index.write_data(index_data, time = time)
+
+        # now do the post-processing
+        for case, index, ts_todo in index_cases:
+            # the post-processed index carries the history of the last timestep computed
+            if len(ts_todo) > 0:
+                case['tags'] = with_history(case, ts_todo[-1])[1]['tags']
+            for post_case in self.cases['post']:
+                ppindex = self._index.update(**{**case['tags'], **post_case['tags']})
+                pp_ts_todo = sorted(all_ts.difference(ppindex.get_times(time_range)))
+                if len(pp_ts_todo) == 0:
+                    self.log.info(f'  Post-processing {post_case["name"]} ({case["name"]}): already calculated.')
+                    continue
+                self.log.info(f'  Post-processing {post_case["name"]} ({case["name"]}): {len(timesteps) - len(pp_ts_todo)}/{len(timesteps)} timesteps already computed.')
+                post_fn = post_case['post_fn']
+                for time in pp_ts_todo:
+                    self.log.info(f'   {time:%d/%m/%Y}')
+                    index_data = index.get_data(time)
+                    ppindex_data = post_fn(index_data)
+                    ppindex.write_data(ppindex_data, time = time)
 
     def calc_parameters(self,
                         time: datetime,
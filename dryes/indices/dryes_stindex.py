@@ -11,7 +11,7 @@ from ..io import IOHandler
 from ..time_aggregation import aggregation_functions as agg
 
 from ..utils.time import TimeRange
-from ..utils.stat import compute_distr_parameters, check_pval, get_prob, map_prob_to_normal
+from ..utils.stat import compute_distr_parameters_array, check_pval, get_prob, map_prob_to_normal
 
 
 class DRYESStandardisedIndex(DRYESIndex):
@@ -101,7 +101,7 @@ class DRYESStandardisedIndex(DRYESIndex):
             for distr in self.distributions:
                 # fit the distribution to calculate the parameters
                 distr_parnames  = self.distr_par[distr]
-                distr_parvalues = np.apply_along_axis(compute_distr_parameters, axis=0, arr=data, distribution=distr, positive_only = self.positive_only)
+                distr_parvalues = compute_distr_parameters_array(data, distribution=distr, positive_only = self.positive_only)
 
                 # check the p-value of the fit, this needs to be done for each case, as the p-value threshold can be different
                 distr_cases = par_and_cases[distr_parnames[0]] # we use the first parameter name to get the cases
@@ -134,9 +134,10 @@ class DRYESStandardisedIndex(DRYESIndex):
             case['tags']['history_end'] = history.end
 
         distribution = case['options']['distribution']
-        pars_to_get  = self.distr_par[distribution]
+        # this is a copy: distr_par is shared by all instances (and by the threads in make_index)
+        pars_to_get  = list(self.distr_par[distribution])
         if 'prob0' in self._parameters:
-            pars_to_get += ['prob0']
+            pars_to_get.append('prob0')
         parameters   = {par: p.get_data(time, **case['tags']) for par, p in self._parameters.items() if par in pars_to_get}
 
         # calculate the index
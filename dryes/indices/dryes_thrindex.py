@@ -26,6 +26,8 @@ class DRYESThrBasedIndex(DRYESIndex):
     # or if we can have gaps in the processing
     # Threshold based indices are always continuous as they require pooling (for other indices, it depends on the time aggregation)
     iscontinuous = True
+    # the index pools the deviations from the previous timesteps (through the DDI), so it is computed in order
+    parallel_index = False
 
     # default options
     default_options = {
@@ -140,7 +142,8 @@ class DRYESThrBasedIndex(DRYESIndex):
         Use update_ddi to update the DDI from a previous timestep.
         """
 
-        timesteps = create_timesteps(time_range.start, time_range.end, timesteps_per_year)
+        # these are only used to check if the ddi needs to be saved
+        timesteps = set(create_timesteps(time_range.start, time_range.end, timesteps_per_year))
 
         # get all the deviations for the history period
         #input_path = self.output_paths['data']
@@ -159,6 +162,7 @@ class DRYESThrBasedIndex(DRYESIndex):
         cum_deviation_dict = {k:{v['id']:cum_deviation_raw.copy() for v in v} for k,v in cases.items()}
 
         for time, deviation_dict in all_deviations:
+            save_time = time in timesteps
             for thrcase, deviation in deviation_dict.items():
                 for case in cases[thrcase]:
                     cid = case['id']
@@ -171,7 +175,7 @@ class DRYESThrBasedIndex(DRYESIndex):
                     # update the ddi and cumulative drought
                     ddi_dict[thrcase][cid] = ddi
                     cum_deviation_dict[thrcase][cid] += cum_deviation
-                    if time in timesteps:
+                    if save_time:
                     # save the current ddi
                         tags = cases[thrcase][cid]['tags']
                         tags.update(thresholds[thrcase].tags)
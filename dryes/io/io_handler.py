@@ -1,4 +1,4 @@
-from typing import Optional
+from typing import Iterable, Optional
 from datetime import datetime
 import numpy as np
 import xarray as xr
@@ -21,6 +21,27 @@ class IOHandler:
         """
         raise NotImplementedError
     
+    def write_batch(self, data: Iterable[xr.DataArray], times: Iterable[datetime], **kwargs):
+        """
+        Write the data for several times (data and times in the same order).
+        By default this writes each time separately, handlers that can do better should override it.
+        """
+        for this_data, time in zip(data, times):
+            self.write_data(this_data, time = time, **kwargs)
+
+    def supports_batch_write(self, **kwargs) -> bool:
+        """
+        Whether write_batch does better than writing each time separately (for the given tags),
+        if not, it is better to write the data as it comes rather than to collect it first.
+        """
+        return False
+
+    def get_mtime(self, time: Optional[datetime] = None, **kwargs) -> Optional[float]:
+        """
+        Get the modification time of the data for a given time (None if unknown).
+        """
+        return None
+
     def get_times(self, time_range: TimeRange, **kwargs) -> list[datetime]:
         """
         Get a list of times between two dates.
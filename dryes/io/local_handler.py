@@ -1,19 +1,30 @@
-from typing import Optional
+from typing import Iterable, Optional
 from datetime import datetime
 from functools import cached_property
+from collections import OrderedDict
+import threading
+from time import time_ns
+import itertools
 from methodtools import lru_cache
 import os
 import rioxarray
 import numpy as np
+import xarray as xr
 
 from .io_handler import IOHandler
 
 from ..utils.time import TimeRange
-from ..utils.parse import substitute_string
+from ..utils.parse import substitute_string_cached
 
 class LocalIOHandler(IOHandler):
     type = 'local'
 
+    # available times, shared by all the handlers that resolve to the same path pattern
+    # {(raw_path, start, end): (listed, times)}, least recently used first, see get_times
+    _times_cache = OrderedDict()
+    _times_cache_size = 256
+    _times_cache_lock = threading.Lock()
+
     def __init__(self,
                  path: str,
                  file: str,
@@ -29,6 +40,9 @@ class LocalIOHandler(IOHandler):
             self.format = 'GeoTIFF'
         elif self.format.lower() in ['txt']:
             self.format = 'ASCII'
+        elif self.format.lower() in ['zarr']:
+            # all timesteps are stored in the same store (unless the path depends on time), along a time dimension
+            self.format = 'Zarr'
         else:
             raise ValueError(f'Format {self.format} not supported.')
         self.tags = {}
@@ -43,30 +57,111 @@ class LocalIOHandler(IOHandler):
         for time in self._get_times(TimeRange(time_start, time_end)):
             return time
     
-    def _get_times(self, time_range: TimeRange, **kwargs) -> datetime:
+    def _get_times(self, time_range: TimeRange, listed: Optional[dict] = None, **kwargs) -> datetime:
+        # the tags are resolved once, only the time changes in the loop
+        # listed (if given) is filled with {directory: stamp} for the directories that were looked at (see get_listing_stamp)
+        if listed is None: listed = {}
+        raw_path = substitute_string_cached(self.path_pattern, kwargs)
+        if self.format == 'Zarr':
+            yield from self._get_times_zarr(time_range, raw_path, listed)
+            return
+
+        # list each directory once (all the timesteps of a month typically go in the same one),
+        # rather than checking each file individually
+        listings = {}
         for time in time_range:
-            if self.check_data(time, **kwargs):
+            this_dir, this_file = os.path.split(time.strftime(raw_path))
+            if this_dir not in listings:
+                this_dir_ = this_dir if this_dir else '.'
+                # the stamp is taken before listing, so that files added in between are not missed
+                listed[this_dir_] = get_listing_stamp(this_dir_)
+                try:
+                    listings[this_dir] = set(os.listdir(this_dir_))
+                except OSError:
+                    listings[this_dir] = set()
+            if this_file in listings[this_dir]:
                 yield time
 
+    def _get_times_zarr(self, time_range: TimeRange, raw_path: str, listed: dict) -> datetime:
+        # read the time coordinate of each store, rather than checking each time individually
+        if '%' in raw_path:
+            stores = sorted(set(time.strftime(raw_path) for time in time_range))
+        else:
+            stores = [raw_path]
+
+        times = []
+        for store in stores:
+            # appending to a store rewrites the metadata of its time array (see get_zarr_times)
+            time_metadata = get_zarr_time_metadata(store)
+            listed[time_metadata] = get_listing_stamp(time_metadata)
+            times.extend(time for time in get_zarr_times(store) if time_range.start <= time <= time_range.end)
+        yield from sorted(times)
+
     def get_times(self, time_range: TimeRange, **kwargs) -> list[datetime]:
         """
         Get a list of times between two dates.
+        The result is cached for each path pattern and time range (for the most recent _times_cache_size ones),
+        the cache is invalidated when data is written through this class or when the modification time (in ns) or size
+        of any of the directories that were listed to get the times changes.
         """
-        return list(self._get_times(time_range, **kwargs))
+        raw_path = substitute_string_cached(self.path_pattern, kwargs)
+        key = (raw_path, time_range.start, time_range.end)
+
+        with self._times_cache_lock:
+            cached = self._times_cache.get(key)
+            if cached is not None:
+                self._times_cache.move_to_end(key)
+        if cached is not None and all(get_file_stamp(this_dir) == stamp for this_dir, stamp in cached[0].items()):
+            return list(cached[1])
+
+        listed = {}
+        times = list(self._get_times(time_range, listed, **kwargs))
+        with self._times_cache_lock:
+            self._times_cache[key] = (listed, times)
+            self._times_cache.move_to_end(key)
+            while len(self._times_cache) > self._times_cache_size:
+                self._times_cache.popitem(last = False)
+        return list(times)
+
+    @classmethod
+    def _clear_times_cache(cls, raw_path: str) -> None:
+        # the available times for this path pattern are about to change
+        with cls._times_cache_lock:
+            for key in [key for key in cls._times_cache if key[0] == raw_path]:
+                del cls._times_cache[key]
     
     def path(self, time: Optional[datetime] = None, **kwargs):
-        raw_path = substitute_string(self.path_pattern, kwargs)
+        raw_path = substitute_string_cached(self.path_pattern, kwargs)
         path = time.strftime(raw_path) if time is not None else raw_path
         return path
 
     def check_data(self, time: Optional[datetime] = None, **kwargs) -> bool:
         this_path = self.path(time, **kwargs)
+        if self.format == 'Zarr' and time is not None:
+            return time in get_zarr_times(this_path)
         return os.path.exists(this_path)
 
-    @lru_cache(maxsize=256)
+    def get_mtime(self, time: Optional[datetime] = None, **kwargs) -> Optional[float]:
+        this_path = self.path(time, **kwargs)
+        if self.format == 'Zarr' and time is not None:
+            # all times are in the same store, appending a time rewrites the metadata of the time array
+            this_path = get_zarr_time_metadata(this_path)
+        return get_dir_mtime(this_path)
+
     def get_data(self, time: Optional[datetime] = None, **kwargs):
+        # the reads are cached, keyed on the version of the file (or store) written through this module and on its
+        # modification time and size, so that a cached read is not used once the data has been written again
+        this_path = self.path(time, **kwargs)
+        stamp_path = get_zarr_time_metadata(this_path) if self.format == 'Zarr' else this_path
+        return self._get_data(time, (get_write_version(this_path), get_file_stamp(stamp_path)), **kwargs)
+
+    @lru_cache(maxsize=256)
+    def _get_data(self, time: Optional[datetime], stamp: tuple, **kwargs):
         if self.check_data(time, **kwargs):
-            data = rioxarray.open_rasterio(self.path(time, **kwargs))
+            if self.format == 'Zarr':
+                data = read_zarr(self.path(time, **kwargs), time)
+            else:
+                data = read_raster(self.path(time, **kwargs))
             if not hasattr(self, 'template') or self.template is None:
                 self.template = self.make_template_from_data(data)
             return data
@@ -75,14 +170,14 @@ class LocalIOHandler(IOHandler):
 
     def update(self, in_place = False, **kwargs):
         if in_place:
-            self.dir  = substitute_string(self.dir, kwargs)
-            self.file = substitute_string(self.file, kwargs)
+            self.dir  = substitute_string_cached(self.dir, kwargs)
+            self.file = substitute_string_cached(self.file, kwargs)
             self.path_pattern = self.path(**kwargs)
             self.tags.update(kwargs)
             return self
         else:
-            new_path = substitute_string(self.dir, kwargs)
-            new_file = substitute_string(self.file, kwargs)
+            new_path = substitute_string_cached(self.dir, kwargs)
+            new_file = substitute_string_cached(self.file, kwargs)
             new_name = self.name
             new_format = self.format
             new_handler = LocalIOHandler(new_path, new_file, new_name, new_format)
@@ -96,15 +191,51 @@ class LocalIOHandler(IOHandler):
                    time: Optional[datetime] = None,
                    time_format: str = '%Y-%m-%d', **kwargs):
         
+        output_file = self.path(time, **kwargs)
+        output = self._prepare_output(data, output_file, time, time_format, **kwargs)
+
+        if self.format == 'Zarr':
+            write_zarr(output, output_file, time)
+        else:
+            # save the data to a geotiff
+            output.rio.to_raster(output_file, compress = 'lzw')
+            clear_raster_cache(output_file)
+        set_written(output_file)
+
+    def write_batch(self, data: Iterable[np.ndarray],
+                    times: Iterable[datetime],
+                    time_format: str = '%Y-%m-%d', **kwargs):
+        
+        if not self.supports_batch_write(**kwargs):
+            return super().write_batch(data, times, time_format = time_format, **kwargs)
+
+        raw_path = substitute_string_cached(self.path_pattern, kwargs)
+        times = list(times)
+        outputs = [self._prepare_output(this_data, raw_path, time, time_format, **kwargs)
+                   for this_data, time in zip(data, times)]
+        write_zarr_batch(outputs, raw_path, times)
+        set_written(raw_path)
+
+    def supports_batch_write(self, **kwargs) -> bool:
+        # only a zarr store that does not depend on time can take all the times at once
+        raw_path = substitute_string_cached(self.path_pattern, kwargs)
+        return self.format == 'Zarr' and '%' not in raw_path
+
+    def _prepare_output(self, data: np.ndarray, output_file: str,
+                        time: Optional[datetime], time_format: str, **kwargs) -> xr.DataArray:
         if data is None or data.size == 0:
             output = self.template
         else:
             output = self.template.copy(data = data)
 
-        output_file = self.path(time, **kwargs)
+        # the available times for this path pattern are about to change
+        self._clear_times_cache(substitute_string_cached(self.path_pattern, kwargs))
 
-        # create the directory if it does not exist
-        os.makedirs(os.path.dirname(output_file), exist_ok=True)
+        # create the directory if it does not exist: checking first is a single stat, while os.makedirs costs
+        # a few syscalls even when the directory is there, which is almost always (e.g. a month of daily outputs)
+        output_dir = os.path.dirname(output_file)
+        if not os.path.isdir(output_dir):
+            os.makedirs(output_dir, exist_ok=True)
 
         # add metadata
         metadata = {'name': self.name,
@@ -115,6 +246,214 @@ class LocalIOHandler(IOHandler):
         output.attrs.update(metadata)
         
         output.name = self.name
+        return output
+
+def get_dir_mtime(path: str) -> Optional[float]:
+    """
+    Get the modification time of a directory (None if it does not exist).
+    """
+    try:
+        return os.path.getmtime(path)
+    except OSError:
+        return None
+
+def get_file_stamp(path: str) -> Optional[tuple[int, int]]:
+    """
+    Get the modification time (in ns) and size of a file (None if it does not exist).
+    """
+    try:
+        stat = os.stat(path)
+    except OSError:
+        return None
+    return stat.st_mtime_ns, stat.st_size
+
+# a version for each path written through this module, {path: version}, least recently written first, see get_data.
+# The versions only increase: a path that is no longer here (version 0) can not be confused with an earlier write
+_write_versions = OrderedDict()
+_write_versions_size = 4096
+_write_versions_lock = threading.Lock()
+_write_counter = itertools.count(1)
+
+def set_written(path: str) -> None:
+    with _write_versions_lock:
+        _write_versions[path] = next(_write_counter)
+        _write_versions.move_to_end(path)
+        while len(_write_versions) > _write_versions_size:
+            _write_versions.popitem(last = False)
+
+def get_write_version(path: str) -> int:
+    with _write_versions_lock:
+        return _write_versions.get(path, 0)
+
+# the resolution of the modification times of the file system, at worst (e.g. 2 s on FAT, 1 s on some network file systems)
+_mtime_resolution_ns = 2 * 10**9
+def get_listing_stamp(path: str):
+    """
+    Get a stamp of a directory (or file) about to be listed (or read), to tell later on whether it has changed.
+    If it was modified too recently, a change made right after the listing could leave its modification time as it is:
+    the stamp is then a new object, which is not equal to any other stamp, so that the listing is not reused.
+    """
+    now = time_ns()
+    stamp = get_file_stamp(path)
+    if stamp is not None and now - stamp[0] < _mtime_resolution_ns:
+        return object()
+    return stamp
+
+## raster reads, shared by all the handlers (update() creates new handlers, each with its own get_data cache)
+# {path: (stamp, data)}, least recently used first, see read_raster
+_raster_cache = OrderedDict()
+_raster_cache_size = 256
+_raster_cache_lock = threading.Lock()
+
+def read_raster(path: str) -> xr.DataArray:
+    """
+    Read a raster file, so that the same file is not opened again, e.g. for each reference period.
+    A cached read is only used while the modification time and size of the file are the same as when it was read,
+    and it is dropped when the file is written through a handler.
+    """
+    # the stamp is taken before the read: if the file changes in between, the next stamp will not match
+    stamp = get_file_stamp(path)
+    with _raster_cache_lock:
+        cached = _raster_cache.get(path)
+        if cached is not None and cached[0] == stamp:
+            _raster_cache.move_to_end(path)
+            return cached[1]
+
+    data = rioxarray.open_rasterio(path)
+    if stamp is None:
+        return data
+    with _raster_cache_lock:
+        _raster_cache[path] = (stamp, data)
+        _raster_cache.move_to_end(path)
+        while len(_raster_cache) > _raster_cache_size:
+            _raster_cache.popitem(last = False)
+    return data
+
+def clear_raster_cache(path: str) -> None:
+    with _raster_cache_lock:
+        _raster_cache.pop(path, None)
+
+## Zarr stores: one data variable, with a time dimension if the data has a time
+def _open_zarr(store: str) -> xr.Dataset:
+    return xr.open_dataset(store, engine = 'zarr', chunks = None, consolidated = False, decode_coords = 'all')
+
+# time coordinates of the zarr stores, {store: (stamp, times)}, least recently used first, see get_zarr_times
+_zarr_times_cache = OrderedDict()
+_zarr_times_cache_size = 256
+_zarr_times_cache_lock = threading.Lock()
+
+def get_zarr_time_metadata(store: str) -> str:
+    """
+    Get the path to the metadata of the time array of a zarr store (zarr.json, or .zarray for a zarr v2 store).
+    The metadata is rewritten whenever times are appended, unlike the directory of the array
+    (the chunks go in subdirectories of it).
+    """
+    v2_metadata = os.path.join(store, 'time', '.zarray')
+    return v2_metadata if os.path.exists(v2_metadata) else os.path.join(store, 'time', 'zarr.json')
+
+def get_zarr_times(store: str) -> list[datetime]:
+    """
+    Get the times available in a zarr store (sorted), without reading the data.
+    The times are cached for each store (for the most recent _zarr_times_cache_size ones), the cache is invalidated
+    when the store is written through this module or when the modification time or size of the metadata of the time array changes.
+    """
+    # the stamp is taken before the times are read: if the store changes in between, the next stamp will not match
+    stamp = get_listing_stamp(get_zarr_time_metadata(store))
+    with _zarr_times_cache_lock:
+        cached = _zarr_times_cache.get(store)
+        if cached is not None and cached[0] == stamp:
+            _zarr_times_cache.move_to_end(store)
+            return list(cached[1])
+
+    if not os.path.exists(store):
+        return []
+    with _open_zarr(store) as ds:
+        times = sorted(ds.indexes['time'].to_pydatetime()) if 'time' in ds.indexes else []
+    with _zarr_times_cache_lock:
+        _zarr_times_cache[store] = (stamp, times)
+        _zarr_times_cache.move_to_end(store)
+        while len(_zarr_times_cache) > _zarr_times_cache_size:
+            _zarr_times_cache.popitem(last = False)
+    return list(times)
+
+def clear_zarr_times_cache(store: str) -> None:
+    with _zarr_times_cache_lock:
+        _zarr_times_cache.pop(store, None)
+
+def read_zarr(store: str, time: Optional[datetime] = None) -> xr.DataArray:
+    """
+    Read the data for a given time from a zarr store.
+    """
+    with _open_zarr(store) as ds:
+        data = next(iter(ds.data_vars.values()))
+        if time is not None and 'time' in data.dims:
+            data = data.sel(time = time, drop = True)
+        return data.load()
+
+def write_zarr(data: xr.DataArray, store: str, time: Optional[datetime] = None) -> None:
+    """
+    Write the data for a given time to a zarr store.
+    If the time is already in the store, it is overwritten, otherwise it is appended.
+    """
+    if time is None:
+        clear_zarr_times_cache(store)
+        data, var_encoding = _prepare_zarr(data)
+        data.to_dataset().to_zarr(store, mode = 'w', consolidated = False,
+                                  encoding = {data.name: var_encoding})
+        clear_zarr_times_cache(store)
+        return
+
+    write_zarr_batch([data], store, [time])
+
+def write_zarr_batch(data: list[xr.DataArray], store: str, times: list[datetime]) -> None:
+    """
+    Write the data for several times to a zarr store (data and times in the same order).
+    The times that are already in the store are overwritten, the others are appended in a single write.
+    """
+    stored_times = get_zarr_times(store)
+    # the cached times are dropped before and after the write, so that times read while writing are not kept
+    clear_zarr_times_cache(store)
+    try:
+        _write_zarr_batch(data, store, times, stored_times)
+    finally:
+        clear_zarr_times_cache(store)
+
+def _write_zarr_batch(data: list[xr.DataArray], store: str, times: list[datetime], stored_times: list[datetime]) -> None:
+    stored_set = set(stored_times)
+
+    # overwrite the existing times, the store is not necessarily sorted in time, find the position of each
+    to_overwrite = [(this_data, time) for this_data, time in zip(data, times) if time in stored_set]
+    if len(to_overwrite) > 0:
+        with _open_zarr(store) as existing:
+            index = existing.indexes['time']
+        for this_data, time in to_overwrite:
+            i = index.get_loc(time)
+            ds = _prepare_zarr(this_data)[0].expand_dims(time = [time]).to_dataset()
+            ds = ds.drop_vars([v for v in ds.variables if 'time' not in ds[v].dims])
+            ds.to_zarr(store, region = {'time': slice(i, i + 1)}, consolidated = False)
+
+    to_append = [(this_data, time) for this_data, time in zip(data, times) if time not in stored_set]
+    if len(to_append) == 0:
+        return
+
+    prepared = [_prepare_zarr(this_data) for this_data, _ in to_append]
+    stacked = xr.concat([this_data.expand_dims(time = [time]) for (this_data, _), (_, time) in zip(prepared, to_append)],
+                        dim = 'time')
+    if len(stored_times) == 0:
+        # store one timestep per chunk, so that appending a timestep does not rewrite the previous ones
+        var_encoding = prepared[0][1]
+        var_encoding['chunks'] = (1,) + stacked.shape[1:]
+        encoding = {'time': {'units': 'seconds since 1900-01-01 00:00:00', 'dtype': 'int64'},
+                    stacked.name: var_encoding}
+        stacked.to_dataset().to_zarr(store, mode = 'w', consolidated = False, encoding = encoding)
+    else:
+        stacked.to_dataset().to_zarr(store, append_dim = 'time', consolidated = False)
 
-        # save the data to a geotiff
-        output.rio.to_raster(output_file, compress = 'lzw')
\ No newline at end of file
+def _prepare_zarr(data: xr.DataArray) -> tuple[xr.DataArray, dict]:
+    # attributes need to be serializable, the fill value goes in the encoding
+    data = data.copy()
+    fill_value = data.attrs.pop('_FillValue', np.nan)
+    data.attrs.pop('time', None)
+    data.attrs = {k: v if isinstance(v, (str, int, float)) else str(v) for k, v in data.attrs.items()}
+    var_encoding = {'_FillValue': fill_value} if np.issubdtype(data.dtype, np.floating) else {}
+    return data, var_encoding
@@ -1,10 +1,11 @@
 import xarray as xr
 from datetime import datetime
-from typing import Callable
+from typing import Callable, Iterable, Iterator
 import numpy as np
 import warnings
 
 from functools import partial
+from collections import deque
 
 from ..io import IOHandler
 from ..utils.time import get_window
@@ -24,6 +25,8 @@ def average_of_window(size: int, unit: str) -> Callable:
 
         #variable.make(window)
         times_to_get = variable.get_times(window)
+        if len(times_to_get) == 0:
+            return None
 
         data = [variable.get_data(time) for time in times_to_get]
         all_data = np.stack(data, axis = 0)
@@ -34,7 +37,9 @@ def average_of_window(size: int, unit: str) -> Callable:
         # mean = mean.assign_coords(time = time)
         return mean_data
     
-    return partial(_average_of_window, _size = size, _unit = unit)
+    agg_function = partial(_average_of_window, _size = size, _unit = unit)
+    agg_function.rolling = partial(rolling_window, size = size, unit = unit, how = 'mean')
+    return agg_function
 
 #TODO: make sum safe by managing NaNs (nanmean * n = sum, unless there are more than a certain number of NaNs)
 def sum_of_window(size: int, unit: str) -> Callable:
@@ -51,6 +56,8 @@ def sum_of_window(size: int, unit: str) -> Callable:
         
         #variable.make(window)
         times_to_get = variable.get_times(window)
+        if len(times_to_get) == 0:
+            return None
 
         data = [variable.get_data(time) for time in times_to_get]
         all_data = np.stack(data, axis = 0)
@@ -59,4 +66,68 @@ def sum_of_window(size: int, unit: str) -> Callable:
         # sum = sum.assign_coords(time = time)
         return sum_data
     
-    return partial(_sum_of_window, _size = size, _unit = unit)
\ No newline at end of file
+    agg_function = partial(_sum_of_window, _size = size, _unit = unit)
+    agg_function.rolling = partial(rolling_window, size = size, unit = unit, how = 'sum')
+    return agg_function
+
+def rolling_window(variable: IOHandler, times: Iterable[datetime], size: int, unit: str, how: str) -> Iterator[tuple[datetime, np.ndarray]]:
+    """
+    Aggregates the data at all the timesteps requested at once, with a sum or an average ('how') over a certain period.
+    Equivalent to calling sum_of_window/average_of_window on each of the timesteps, but the windows are slid over the data:
+    each input is read once, added when it enters the window and subtracted when it leaves it.
+    Yields (time, data) in chronological order.
+    """
+    window_data = deque() # (time, data) currently in the window
+    nan_sum = None        # sum of the non-NaN values in the window (float64 to limit the rounding drift)
+    n_valid = None        # number of non-NaN values in the window
+
+    for time in sorted(times):
+        window = get_window(time, size, unit)
+        if window.start < variable.start:
+            yield time, None
+            continue
+
+        times_to_get = variable.get_times(window)
+        # no data in the window (e.g. a gap in the data), same as sum_of_window/average_of_window
+        if len(times_to_get) == 0:
+            yield time, None
+            continue
+
+        # drop the data that left the window
+        while len(window_data) > 0 and window_data[0][0] < times_to_get[0]:
+            _, data = window_data.popleft()
+            nan_sum -= np.where(np.isnan(data), 0, data)
+            n_valid -= ~np.isnan(data)
+
+        # if the window is not a continuation of the previous one, start over
+        in_window = [t for t, _ in window_data]
+        if in_window != times_to_get[:len(in_window)]:
+            window_data.clear()
+            in_window = []
+        if len(window_data) == 0:
+            nan_sum = n_valid = None
+
+        # add the data that entered the window
+        for t in times_to_get[len(in_window):]:
+            data = np.asarray(variable.get_data(t))
+            window_data.append((t, data))
+            if nan_sum is None:
+                dtype = data.dtype
+                nan_sum = np.zeros(data.shape, dtype = np.float64)
+                n_valid = np.zeros(data.shape, dtype = np.int64)
+            nan_sum += np.where(np.isnan(data), 0, data)
+            n_valid += ~np.isnan(data)
+
+        # the output types are the same as np.sum and np.nanmean on the stacked data
+        with warnings.catch_warnings():
+            warnings.simplefilter("ignore", category=RuntimeWarning)
+            if how == 'sum':
+                # like np.sum, any NaN in the window makes the sum NaN
+                out = np.where(n_valid == len(window_data), nan_sum, np.nan)
+                out_dtype = np.sum(np.zeros(1, dtype = dtype)).dtype
+            elif how == 'mean':
+                out = nan_sum / n_valid
+                out_dtype = np.nanmean(np.zeros(1, dtype = dtype)).dtype
+            else:
+                raise ValueError(f'Unknown rolling aggregation: {how}')
+        yield time, out.astype(out_dtype)
\ No newline at end of file
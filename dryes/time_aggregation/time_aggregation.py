@@ -24,6 +24,8 @@ class TimeAggregation:
         Adds an aggregation (and possibly a post_aggregation) function to the TimeAggregation object.
         Aggregation functions operate on individual timesteps, post_aggregation functions on all timesteps at once:
             they are useful for example for exponential smoothing.
+        post_aggregation functions receive the list of aggregated data in chronological order
+        and must return a list of the same length, in the same order.
         """
         self.aggfun[name] = function
         if post_function is not None:
@@ -1,6 +1,6 @@
 from datetime import datetime
 import itertools
-import copy
+import functools
 
 def substitute_values(structure, tag_dict, rec = False):
     """
@@ -24,7 +24,6 @@ def substitute_string(string, tag_dict, rec = False):
     """
     while "{" in string and "}" in string:
         for key, value in tag_dict.items():
-            #if key == "history_start" : breakpoint()
             # check if the value is a datetime object and the string contains a format specifier for the key
             if isinstance(value, datetime) and '{' + key + ':' in string:
                 # extract the format specifier from the string
@@ -38,6 +37,21 @@ def substitute_string(string, tag_dict, rec = False):
             break
     return string
 
+@functools.lru_cache(maxsize=4096)
+def _substitute_string_cached(string, tag_items, rec = False):
+    return substitute_string(string, {key: value for key, value, _ in tag_items}, rec)
+
+def substitute_string_cached(string, tag_dict, rec = False):
+    """
+    same as substitute_string, but memoized on the string and the tags (when the tags are hashable)
+    """
+    # the type is part of the key, so that 1 and 1.0 (which hash the same) are not confused
+    tag_items = tuple((key, value, type(value)) for key, value in tag_dict.items())
+    try:
+        return _substitute_string_cached(string, tag_items, rec)
+    except TypeError:
+        return substitute_string(string, tag_dict, rec)
+
 def make_case_hierarchy(cases, opt_groups):
     options = cases_to_options(cases)
     option_hierarchy = make_option_hierarchy(options, opt_groups)
@@ -54,7 +68,6 @@ def make_option_hierarchy(options, opt_groups):
     for i in range(len(opt_groups)):
         opts = opt_groups[i]
         #for j in range(i+1): opts += opt_groups[j]
-        #breakpoint()
         group_options = {k: v for k, v in options.items() if k in opts}
         fixed_options = {k: v for k, v in group_options.items() if not isinstance(v, dict)}
         to_permutate = {k: [{kv:vv} for kv,vv in v.items()] 
@@ -66,7 +79,6 @@ def make_option_hierarchy(options, opt_groups):
         for p in permutations:
             p.update(fixed_options)
         opt_permutations.append(permutations)
-        #breakpoint()
     
     opt_hierarchy = []
     for i in range(len(opt_groups)):
@@ -76,11 +88,10 @@ def make_option_hierarchy(options, opt_groups):
         else:
             this_level_options = []
             for old_options in  opt_permutations[i-1]: #.copy()
-            #breakpoint()
             #new_options = combine_options(old_options, these_options)
             #this_level_options.append(new_options)
                 #new_options = combine_options(old_options, these_options)
-                new_options = copy.deepcopy(these_options)
+                new_options = these_options.copy()
                 new_options.update(old_options)
                 this_level_options.append(new_options)
             opt_hierarchy.append(this_level_options)
@@ -92,7 +103,6 @@ def combine_options(old_options, new_options):
     if levels == 1:
         combined = []
         for options in old_options[0]:
-            #if isinstance(options, str): breakpoint()
             these_options = options.copy()
             if not isinstance(new_options, list): new_options = [new_options]
             for new_option_set in new_options:
@@ -135,21 +145,6 @@ def combine_options(old_options, new_options):
     #                 these_options.append(this_parent)
     #             opt_hierarchy[i].append(these_options)
           
-def permutate_options(options):
-
-    # get the options that need to be permutated and the ones that are fixed
-    fixed_options = {k: v for k, v in options.items() if not isinstance(v, dict)}
-    to_permutate = {k: list(v.keys()) for k, v in options.items() if isinstance(v, dict)}
-    values_to_permutate = [v for v in to_permutate.values()]
-    keys = list(to_permutate.keys())
-
-    permutations = [dict(zip(keys, p)) for p in itertools.product(*values_to_permutate)]
-    identifiers = copy.deepcopy(permutations)
-    for permutation in permutations:
-        permutation.update(fixed_options)
-
-    return permutations, identifiers
-
 def cases_to_options(cases):
     """
     convert the cases to options -> this is the reverse of options_to_cases
@@ -176,28 +171,28 @@ def options_to_cases(options):
         return cases
     
     # get the options that need to be permutated and the ones that are fixed
-    permutations, identifiers = permutate_options(options)
-
-    cases_opts = []
-    for permutation in permutations:
-        this_case_opts = {}
-        for k, v in permutation.items():
-            # if this is one of the options that we permutated
-            if isinstance(options[k], dict):
-                this_case_opts[k] = options[k][v]
-            # if not, this is fixed
-            else:
-                this_case_opts[k] = v
-                permutation[k] = ""
-        cases_opts.append(this_case_opts)
+    fixed_options = {k: v for k, v in options.items() if not isinstance(v, dict)}
+    to_permutate = {k: list(v.keys()) for k, v in options.items() if isinstance(v, dict)}
+    values_to_permutate = [v for v in to_permutate.values()]
+    keys = list(to_permutate.keys())
 
+    # build the cases one permutation at a time, without materializing all the permutations first
     opt_cases = []
-    for case, permutation, i in zip(cases_opts, permutations, range(len(identifiers))):
+    for i, p in enumerate(itertools.product(*values_to_permutate)):
+        name_parts = {k: p[idx] for idx, k in enumerate(keys)}
+
+        this_case_opts = {k: options[k][v] for k, v in name_parts.items()}
+        this_case_opts.update(fixed_options)
+
+        # fixed options are tagged with an empty string (see cases_to_options)
+        this_case_tags = name_parts.copy()
+        this_case_tags.update({k: "" for k in fixed_options})
+
         this_case = dict()
         this_case['id']   = i
-        this_case['name'] = ','.join(v for v in permutation.values() if v != "")
-        this_case['tags'] = {pk:pv for pk,pv in permutation.items()}
-        this_case['options'] = case
+        this_case['name'] = ','.join(v for v in name_parts.values() if v != "")
+        this_case['tags'] = this_case_tags
+        this_case['options'] = this_case_opts
         opt_cases.append(this_case)
 
     return opt_cases
\ No newline at end of file
@@ -1,5 +1,6 @@
 import numpy as np
 import scipy.stats as stat
+from scipy import special
 from lmoments3 import distr
 from typing import Iterable
 
@@ -45,6 +46,116 @@ def compute_distr_parameters(x: Iterable[float], distribution: str,
     
     return fit
 
+# Same as compute_distr_parameters, but for all the pixels at once: x has the samples along the first axis
+# the output has the parameters along the first axis (in the same order as compute_distr_parameters)
+# the pixels are processed in blocks of block_size, so that the temporary arrays stay small
+def compute_distr_parameters_array(x: np.ndarray, distribution: str,
+                                   min_obs: int = 5,
+                                   positive_only: bool = True,
+                                   block_size: int = 2**16) -> np.ndarray:
+    x = np.asarray(x)
+
+    if distribution == 'gamma':
+        positive_only = True
+        parnames = ['a', 'loc', 'scale']
+    elif distribution == 'normal':
+        parnames = ['loc', 'scale']
+    elif distribution == 'pearson3':
+        parnames = ['skew', 'loc', 'scale']
+    else:
+        # there is no closed form for the other distributions, fit them one pixel at a time
+        return np.apply_along_axis(compute_distr_parameters, axis=0, arr=x, distribution=distribution,
+                                   min_obs=min_obs, positive_only=positive_only)
+
+    shape = x.shape[1:]
+    x = x.reshape(x.shape[0], -1)
+
+    fit = np.empty((len(parnames), x.shape[1]))
+    for start in range(0, x.shape[1], block_size):
+        block = slice(start, start + block_size)
+        pars = _fit_lmom_block(x[:, block].astype(np.float64), distribution, min_obs, positive_only)
+        for i, pn in enumerate(parnames):
+            fit[i, block] = pars[pn]
+
+    return fit.reshape((len(parnames),) + shape)
+
+def _fit_lmom_block(x: np.ndarray, distribution: str, min_obs: int, positive_only: bool) -> dict[str:np.ndarray]:
+    # sort each pixel, the values that are not used are set to NaN (and end up at the bottom)
+    if positive_only:
+        x = np.where(x > 0, x, np.nan)
+        invalid = np.zeros(x.shape[1], dtype = bool)
+    else:
+        invalid = np.any(np.isnan(x), axis = 0) # NaNs in the sample propagate to the parameters
+    x = np.sort(x, axis = 0)
+    n = np.sum(~np.isnan(x), axis = 0)
+    invalid |= n <= min_obs
+    x = np.where(np.isnan(x), 0, x)
+
+    with np.errstate(divide = 'ignore', invalid = 'ignore'):
+        l1, l2, t3 = sample_lmom_ratios(x, n)
+
+        if distribution == 'gamma':
+            invalid |= ~((l1 > l2) & (l2 > 0))
+            pars = lmom_fit_gamma(l1, l2)
+        elif distribution == 'normal':
+            invalid |= ~(l2 > 0)
+            pars = lmom_fit_normal(l1, l2)
+        elif distribution == 'pearson3':
+            invalid |= ~((l2 > 0) & (np.abs(t3) < 1))
+            pars = lmom_fit_pearson3(l1, l2, t3)
+
+    return {pn: np.where(invalid, np.nan, par) for pn, par in pars.items()}
+
+# Sample L-moments (l1, l2) and L-skewness (t3) of sorted samples along the first axis,
+# n is the number of samples for each pixel (the values after the first n are ignored)
+def sample_lmom_ratios(x: np.ndarray, n: np.ndarray) -> tuple[np.ndarray]:
+    i = np.arange(x.shape[0])[:, None] # number of samples smaller than x[i]
+    j = n[None, :] - 1 - i             # number of samples larger than x[i]
+    used = j >= 0
+
+    def comb2(k): return k * (k - 1) / 2
+    def comb3(k): return k * (k - 1) * (k - 2) / 6
+
+    l1 = np.sum(x, axis = 0) / n
+    l2 = 0.5 / comb2(n) * np.sum(np.where(used, i - j, 0) * x, axis = 0)
+    l3 = 1 / 3 / comb3(n) * np.sum(np.where(used, comb2(i) - 2 * i * j + comb2(j), 0) * x, axis = 0)
+    return l1, l2, l3 / l2
+
+# L-moment fits, these follow the ones in lmoments3 (Hosking's routines), for arrays of L-moments
+def lmom_fit_gamma(l1: np.ndarray, l2: np.ndarray) -> dict[str:np.ndarray]:
+    A1, A2, A3 = -0.3080, -0.05812, 0.01765
+    B1, B2, B3, B4 = 0.7213, -0.5947, -2.1817, 1.2113
+
+    CV = l2 / l1
+    T = np.where(CV >= 0.5, 1 - CV, np.pi * CV**2)
+    alpha = np.where(CV >= 0.5,
+                     T * (B1 + T * B2) / (1 + T * (B3 + T * B4)),
+                     (1 + A1 * T) / (T * (1 + T * (A2 + T * A3))))
+    return {'a': alpha, 'loc': np.zeros_like(alpha), 'scale': l1 / alpha}
+
+def lmom_fit_normal(l1: np.ndarray, l2: np.ndarray) -> dict[str:np.ndarray]:
+    return {'loc': l1, 'scale': l2 * np.sqrt(np.pi)}
+
+def lmom_fit_pearson3(l1: np.ndarray, l2: np.ndarray, t3: np.ndarray) -> dict[str:np.ndarray]:
+    C1, C2, C3 = 0.2906, 0.1882, 0.0442
+    D1, D2, D3, D4, D5, D6 = 0.36067, -0.59567, 0.25361, -2.78861, 2.56096, -0.77045
+    small = 1e-6
+
+    T3 = np.abs(t3)
+    T = np.where(T3 >= 1/3, 1 - T3, 3 * np.pi * T3 * T3)
+    alpha = np.where(T3 >= 1/3,
+                     T * (D1 + T * (D2 + T * D3)) / (1 + T * (D4 + T * (D5 + T * D6))),
+                     (1 + C1 * T) / (T * (1 + T * (C2 + T * C3))))
+    rtalpha = np.sqrt(alpha)
+    beta = np.sqrt(np.pi) * l2 * np.exp(special.gammaln(alpha) - special.gammaln(alpha + 0.5))
+
+    skew  = np.where(t3 < 0, -2 / rtalpha, 2 / rtalpha)
+    scale = beta * rtalpha
+    # (almost) symmetric: this is a normal distribution
+    skew  = np.where(T3 <= small, 0, skew)
+    scale = np.where(T3 <= small, l2 * np.sqrt(np.pi), scale)
+    return {'skew': skew, 'loc': l1, 'scale': scale}
+
 # Checks if the p-value of the Kolmogorov-Smirnov test is above the threshold
 def check_pval(x: Iterable[float], distribution: str,
                fit = np.ndarray,
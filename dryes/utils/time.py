@@ -1,37 +1,79 @@
 from datetime import datetime, timedelta
 from dateutil.relativedelta import relativedelta
+import functools
 import numpy as np
 
-from typing import List
-
 class TimeRange():
+    # many TimeRanges are created (e.g. one per reference period and per window), no need for a __dict__
+    __slots__ = ('start', 'end')
+    isrange = True
+
     def __init__(self, start: datetime, end: datetime):
         """
         Creates a TimeRange object. Useful to download data from a data source.
         If a timerange object is passed to data source, the data source will
         download all the data between the two dates.
         """
-        self.isrange = True
-        self.start = start
-        self.end = end
+        object.__setattr__(self, 'start', start)
+        object.__setattr__(self, 'end', end)
+
+    # a TimeRange is hashed on its start and end (and used as a key in caches), so it can't change once created
+    def __setattr__(self, name, value):
+        raise AttributeError(f'TimeRange is immutable, cannot set {name}')
+
+    def __delattr__(self, name):
+        raise AttributeError(f'TimeRange is immutable, cannot delete {name}')
+
+    def __reduce__(self):
+        # copy and pickle go through __init__, rather than setting the attributes
+        return (TimeRange, (self.start, self.end))
+
+    # two TimeRanges with the same start and end are the same, so they can be used as keys in caches
+    def __eq__(self, other):
+        if not isinstance(other, TimeRange):
+            return NotImplemented
+        return self.start == other.start and self.end == other.end
+
+    def __hash__(self):
+        return hash((self.start, self.end))
+
+    def __repr__(self):
+        return f'TimeRange({self.start!r}, {self.end!r})'
     
     def __iter__(self):
-        self.now = self.start
-        return self
-    
-    def __next__(self):
-        if self.now > self.end:
-            raise StopIteration
-        now = self.now
-        self.now+= timedelta(days=1)
-        return now
-
-def create_timesteps(time_start: datetime, time_end: datetime, n_intervals: int) -> list[datetime]:
+        # a new iterator each time, so that the same TimeRange can be iterated more than once at the same time
+        return iter(self.days().tolist())
+
+    def days(self) -> np.ndarray:
+        """
+        All the days in the TimeRange (from start, with the same time of the day), as numpy.datetime64.
+        """
+        return np.arange(np.datetime64(self.start, 'us'), np.datetime64(self.end, 'us') + np.timedelta64(1, 'us'),
+                         np.timedelta64(1, 'D'))
+
+# (months, days) of the timesteps in each year, for each number of intervals (except 365, which is daily)
+_ANCHORS = {1:  ((1,),                  (1,)),
+            2:  ((1, 7),                (1,)),
+            3:  ((1, 5, 9),             (1,)),
+            4:  ((1, 4, 7, 10),         (1,)),
+            6:  ((1, 3, 5, 7, 9, 11),   (1,)),
+            12: (tuple(range(1, 13)),   (1,)),
+            24: (tuple(range(1, 13)),   (1, 16)),
+            36: (tuple(range(1, 13)),   (1, 11, 21))}
+
+@functools.lru_cache(maxsize=256)
+def create_timesteps(time_start: datetime, time_end: datetime, n_intervals: int) -> tuple[datetime]:
     """
-    Creates a list of timesteps between two dates.
+    Creates a tuple of timesteps between two dates.
     n_intervals is the number of subdivisions of the year to consider.
     n_intervals can only take as value 1, 2, 3, 4, 6, 12, 24, 36, 365.
+    The result is cached (and immutable), as the same timesteps are requested many times.
+    """
+    return tuple(create_timesteps64(time_start, time_end, n_intervals).tolist())
 
+def create_timesteps64(time_start: datetime, time_end: datetime, n_intervals: int) -> np.ndarray:
+    """
+    Same as create_timesteps, but the timesteps are returned as a (sorted) numpy.datetime64 array.
     """
     start_year = time_start.year
     end_year = time_end.year
@@ -39,32 +81,27 @@ def create_timesteps(time_start: datetime, time_end: datetime, n_intervals: int)
     if n_intervals not in [1, 2, 3, 4, 6, 12, 24, 36, 365]:
         raise ValueError("Invalid number of intervals. Must be a positive integer that divides 12, 24, or 36 evenly.")
 
-    if n_intervals == 1:
-        timesteps =  [datetime(year,     1,   1) for year in range(start_year, end_year + 1)]
-    elif n_intervals == 2:
-        timesteps =  [datetime(year, month,   1) for year in range(start_year, end_year + 1) for month in [1, 7]]
-    elif n_intervals == 3:
-        timesteps =  [datetime(year, month,   1) for year in range(start_year, end_year + 1) for month in [1, 5, 9]]
-    elif n_intervals == 4:
-        timesteps =  [datetime(year, month,   1) for year in range(start_year, end_year + 1) for month in [1, 4, 7, 10]]
-    elif n_intervals == 6:
-        timesteps =  [datetime(year, month,   1) for year in range(start_year, end_year + 1) for month in [1, 3, 5, 7, 9, 11]]
-    elif n_intervals == 12:
-        timesteps =  [datetime(year, month,   1) for year in range(start_year, end_year + 1) for month in range(1, 13)]
-    elif n_intervals == 24:
-        timesteps =  [datetime(year, month, day) for year in range(start_year, end_year + 1) for month in range(1, 13) for day in [1, 16]]
-    elif n_intervals == 36:
-        timesteps =  [datetime(year, month, day) for year in range(start_year, end_year + 1) for month in range(1, 13) for day in [1, 11, 21]]
-    elif n_intervals == 365:
-        timesteps =  [time_start]
-        new_timestep = time_start
-        while new_timestep < time_end:
-            new_timestep = new_timestep + timedelta(days=1)
-            if (new_timestep.month, new_timestep.day) != (2, 29):
-                timesteps.append(new_timestep)
-
-    timesteps = [time for time in timesteps if time >= time_start and time <= time_end]
-    return timesteps
+    if n_intervals == 365:
+        # every day (from time_start, so that the time of the day is kept) except 29 February,
+        # time_start is kept even if it is a 29 February
+        days = TimeRange(time_start, time_end).days()
+        months = days.astype('datetime64[M]')
+        is_feb29 = (months.astype(int) % 12 == 1) & ((days.astype('datetime64[D]') - months).astype(int) == 28)
+        is_feb29[:1] = False
+        return days[~is_feb29]
+
+    months, days = _ANCHORS[n_intervals]
+
+    # (year, month, day) for all the combinations, in chronological order
+    years = np.arange(start_year, end_year + 1)
+    first_of_month = ((years[:, None] - 1970) * 12 + np.array(months)[None, :] - 1).astype('datetime64[M]')
+    timesteps = first_of_month.astype('datetime64[us]')[:, :, None] + (np.array(days) - 1).astype('timedelta64[D]')[None, None, :]
+    timesteps = timesteps.ravel()
+
+    # the timesteps are sorted, so we only need to find where to cut them
+    first = np.searchsorted(timesteps, np.datetime64(time_start, 'us'), side = 'left')
+    last  = np.searchsorted(timesteps, np.datetime64(time_end, 'us'),   side = 'right')
+    return timesteps[first:last]
 
 def get_interval(date: datetime, num_intervals: int = 12) -> int:
     if num_intervals not in [1, 2, 3, 4, 6, 12, 24, 36]:
@@ -80,13 +117,14 @@ def get_interval(date: datetime, num_intervals: int = 12) -> int:
     month = date.month
     day = date.day
     
+    # integer ceiling division, no need to go through numpy for scalars
     if num_intervals in [1, 2, 3, 4, 6, 12]:
-        interval = np.ceil(month / interval_length)
+        interval = (month + interval_length - 1) // interval_length
     else:
         intervals_per_month = num_intervals // 12
-        interval = (month - 1) * intervals_per_month + min(np.ceil(day / interval_length), intervals_per_month)
+        interval = (month - 1) * intervals_per_month + min((day + interval_length - 1) // interval_length, intervals_per_month)
     
-    return int(interval)
+    return interval
 
 def get_interval_date(date: datetime, num_intervals: int = 12, end: bool = False) -> datetime:
     interval = get_interval(date, num_intervals)
@@ -118,7 +156,7 @@ def get_date_from_interval(interval: int, year: int, num_intervals: int = 12, en
     
     else:
         intervals_per_month = num_intervals // 12
-        month = int(np.floor((interval - 1) / intervals_per_month) + 1)
+        month = int((interval - 1) // intervals_per_month + 1)
         in_month_interval = (interval - 1) % intervals_per_month + 1
         day = (in_month_interval - 1) * interval_length + 1
         if end:
@@ -144,9 +182,14 @@ def doy_to_md(doy:int) -> tuple[int, int]:
     date = datetime(1987, 1, 1) + timedelta(days = doy - 1)
     return (date.month, date.day)
 
-def ntimesteps_to_md(timesteps_per_year: int) -> List[tuple[int, int]]:
-    timesteps = create_timesteps(datetime(1987, 1, 1), datetime(1987, 12, 31), timesteps_per_year)
-    return [(time.month, time.day) for time in timesteps] 
+@functools.lru_cache(maxsize=None)
+def ntimesteps_to_md(timesteps_per_year: int) -> tuple[tuple[int, int]]:
+    # there are only a handful of possible values for timesteps_per_year, so the cache is not bounded
+    timesteps = create_timesteps64(datetime(1987, 1, 1), datetime(1987, 12, 31), timesteps_per_year)
+    months = timesteps.astype('datetime64[M]')
+    month_numbers = months.astype(int) % 12 + 1
+    day_numbers   = (timesteps.astype('datetime64[D]') - months).astype(int) + 1
+    return tuple(zip(month_numbers.tolist(), day_numbers.tolist()))
 
 def get_window(time: datetime, size: int, unit: str) -> TimeRange:
         time_end = time - timedelta(days=1)
@@ -155,9 +198,9 @@ def get_window(time: datetime, size: int, unit: str) -> TimeRange:
             time_start = time - relativedelta(**{unit: size})
         elif unit == 'dekads':
             if time_end == get_interval_date(time_end, 36, end = True):
-                tmp_time = time_end
-                for i in range(size): tmp_time = get_interval_date(tmp_time, 36) - timedelta(days=1)
-                time_start = tmp_time + timedelta(days=1)
+                # go back size - 1 dekads from the one of time_end (counting dekads from year 0), and take its start
+                start_dekad = time_end.year * 36 + get_interval(time_end, 36) - size
+                time_start = get_date_from_interval(start_dekad % 36 + 1, start_dekad // 36, 36)
             else:
                 time_start = time - timedelta(days = 10 * size)
         else:
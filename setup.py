@@ -27,6 +27,9 @@ setup(
         'scipy>=1.8.0',
         'xarray>=2023.9.0', 
     ],
+    extras_require={
+        'zarr': ['zarr>=2.16.0'],
+    },
     python_requires='>=3.10',
     test_suite='tests',
 )
\ No newline at end of file
@@ -0,0 +1,62 @@
+import unittest
+import tempfile
+import os
+
+import numpy as np
+import xarray as xr
+from datetime import datetime
+
+from dryes.io import LocalIOHandler
+from dryes.indices import DRYESAnomaly
+from dryes.time_aggregation import aggregation_functions as agg
+from dryes.utils.time import TimeRange
+
+class TestAnomalyParameters(unittest.TestCase):
+    def setUp(self):
+        self.tmpdir = tempfile.TemporaryDirectory()
+        self.data = LocalIOHandler(path = os.path.join(self.tmpdir.name, 'data'), file = 'd{case}_%Y%m%d.tif')
+
+        # one value per year, with a large offset and a small spread (e.g. FAPAR) and some NaNs
+        rng = np.random.default_rng(0)
+        coords = {"x": np.linspace(-50, 40, 6), "y": np.linspace(50, -40, 6)}
+        template = xr.DataArray(np.zeros((6, 6), dtype = np.float32), coords = coords, dims = ["y", "x"])
+        template.rio.set_spatial_dims(x_dim = "x", y_dim = "y", inplace = True)
+        template.rio.write_crs("EPSG:4326", inplace = True)
+        self.data.template = template
+        self.offsets = {'fapar': 0.5, 'large': 1e4}
+        for year in range(2000, 2012):
+            for name, offset in self.offsets.items():
+                data = (offset + offset * 1e-6 * rng.standard_normal((6, 6))).astype(np.float32)
+                data[rng.random((6, 6)) < 0.1] = np.nan
+                data[0, 0] = np.nan
+                self.data.write_data(data, time = datetime(year, 3, 15), case = name)
+
+        out = os.path.join(self.tmpdir.name, 'out')
+        self.index = DRYESAnomaly(index_options = {'agg_fn': {}, 'type': 'empiricalzscore'},
+                                  io_options = {'data':  self.data.update(case = 'fapar'),
+                                                'mean':  LocalIOHandler(path = os.path.join(out, 'par'), file = 'mean_%m%d.tif'),
+                                                'std':   LocalIOHandler(path = os.path.join(out, 'par'), file = 'std_%m%d.tif'),
+                                                'log':   LocalIOHandler(path = out, file = 'log.txt'),
+                                                'index': LocalIOHandler(path = os.path.join(out, 'maps'), file = 'an_%Y%m%d.tif')})
+
+    def tearDown(self):
+        self.tmpdir.cleanup()
+
+    def test_running_sums(self):
+        time = datetime(2011, 3, 15)
+        for name in self.offsets:
+            variable = self.data.update(case = name)
+            # the first history starts the sums, the others add a year and remove another
+            for start in [2000, 2001, 2002]:
+                history = TimeRange(datetime(start, 1, 1), datetime(start + 8, 12, 31))
+                output = self.index.calc_parameters(time, variable, history, {'mean': [0], 'std': [0]})
+
+                stack = np.stack([variable.get_data(datetime(year, 3, 15)).values for year in range(start, start + 9)], axis = 0)
+                np.testing.assert_array_equal(np.isnan(output['mean'][0]), np.all(np.isnan(stack), axis = 0))
+                np.testing.assert_allclose(output['mean'][0], np.nanmean(stack.astype(np.float64), axis = 0), rtol = 1e-6)
+                np.testing.assert_allclose(output['std'][0],  np.nanstd(stack.astype(np.float64), axis = 0),  rtol = 1e-5)
+                self.assertEqual(output['mean'][0].dtype, np.nanmean(stack, axis = 0).dtype)
+            self.assertEqual(len(self.index._history_sums), list(self.offsets).index(name) + 1)
+
+if __name__ == '__main__':
+    unittest.main()
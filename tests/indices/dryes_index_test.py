@@ -0,0 +1,65 @@
+import unittest
+from unittest.mock import patch
+import tempfile
+import os
+
+import numpy as np
+import xarray as xr
+from datetime import datetime, timedelta
+
+from dryes.io import LocalIOHandler
+from dryes.indices import DRYESAnomaly
+from dryes.time_aggregation import aggregation_functions as agg
+from dryes.utils.time import TimeRange, create_timesteps
+
+class TestMakeInputData(unittest.TestCase):
+    def setUp(self):
+        self.tmpdir = tempfile.TemporaryDirectory()
+        self.raw = LocalIOHandler(path = os.path.join(self.tmpdir.name, 'raw'), file = 'p_%Y%m%d.tif')
+
+        # daily data, with some NaNs
+        rng = np.random.default_rng(0)
+        coords = {"x": np.linspace(-50, 40, 6), "y": np.linspace(50, -40, 6)}
+        template = xr.DataArray(np.zeros((6, 6), dtype = np.float32), coords = coords, dims = ["y", "x"])
+        template.rio.set_spatial_dims(x_dim = "x", y_dim = "y", inplace = True)
+        template.rio.write_crs("EPSG:4326", inplace = True)
+        self.raw.template = template
+        for i in range(120):
+            data = rng.gamma(2, 3, size = (6, 6)).astype(np.float32)
+            data[rng.random((6, 6)) < 0.05] = np.nan
+            self.raw.write_data(data, time = datetime(2020, 1, 1) + timedelta(days = i))
+
+        # a rolling aggregation and one that is computed one timestep at a time
+        average = agg.average_of_window(1, 'months')
+        self.agg_fn = {'avg': average, 'sum': agg.sum_of_window(2, 'months'),
+                       'plain': lambda variable, time: average(variable, time)}
+        out = os.path.join(self.tmpdir.name, 'out')
+        self.index = DRYESAnomaly(index_options = {'agg_fn': self.agg_fn, 'type': 'empiricalzscore'},
+                                  io_options = {'data_raw': self.raw,
+                                                'data':  LocalIOHandler(path = os.path.join(out, 'data'), file = 'd{agg_fn}_%Y%m%d.tif'),
+                                                'mean':  LocalIOHandler(path = os.path.join(out, 'par'), file = 'mean{agg_fn}_%m%d.tif'),
+                                                'std':   LocalIOHandler(path = os.path.join(out, 'par'), file = 'std{agg_fn}_%m%d.tif'),
+                                                'log':   LocalIOHandler(path = out, file = 'log.txt'),
+                                                'index': LocalIOHandler(path = os.path.join(out, 'maps'), file = 'an{agg_fn}_%Y%m%d.tif')})
+        self.timesteps = list(create_timesteps(datetime(2020, 3, 1), datetime(2020, 4, 29), 36))
+
+    def tearDown(self):
+        self.tmpdir.cleanup()
+
+    def test_written_data(self):
+        self.index.make_input_data(self.timesteps)
+        time_range = TimeRange(self.timesteps[0], self.timesteps[-1])
+        for agg_name, agg_function in self.agg_fn.items():
+            data = self.index._data.update(agg_fn = agg_name)
+            self.assertEqual(data.get_times(time_range), self.timesteps)
+            for time in self.timesteps:
+                np.testing.assert_allclose(data.get_data(time).values, agg_function(self.raw, time), rtol = 1e-5)
+
+    def test_write_error(self):
+        # an error in the writer thread reaches the caller
+        with patch.object(LocalIOHandler, 'write_data', side_effect = OSError('disk full')):
+            with self.assertRaises(OSError):
+                self.index.make_input_data(self.timesteps)
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,73 @@
+import unittest
+import tempfile
+import os
+
+import numpy as np
+import xarray as xr
+from datetime import datetime
+
+from dryes.io import LocalIOHandler
+from dryes.indices import SPI
+from dryes.time_aggregation import aggregation_functions as agg
+from dryes.utils.time import TimeRange
+
+class TestSPIParallelIndex(unittest.TestCase):
+    def setUp(self):
+        self.tmpdir = tempfile.TemporaryDirectory()
+        self.raw = LocalIOHandler(path = os.path.join(self.tmpdir.name, 'raw'), file = 'p_%Y%m%d.tif')
+
+        # monthly data, with some zeros and NaNs
+        rng = np.random.default_rng(0)
+        coords = {"x": np.linspace(-50, 40, 6), "y": np.linspace(50, -40, 6)}
+        template = xr.DataArray(np.zeros((6, 6), dtype = np.float32), coords = coords, dims = ["y", "x"])
+        template.rio.set_spatial_dims(x_dim = "x", y_dim = "y", inplace = True)
+        template.rio.write_crs("EPSG:4326", inplace = True)
+        self.raw.template = template
+        for year in range(2010, 2020):
+            for month in range(1, 13):
+                data = (rng.gamma(0.8, 3, size = (6, 6)) * (rng.random((6, 6)) > 0.2)).astype(np.float32)
+                data[0, 0] = np.nan
+                self.raw.write_data(data, time = datetime(year, month, 1))
+
+    def tearDown(self):
+        self.tmpdir.cleanup()
+
+    def make_spi(self, out: str) -> SPI:
+        out = os.path.join(self.tmpdir.name, out)
+        parameters = {par: LocalIOHandler(path = os.path.join(out, 'par'), file = par + '{agg_fn}_%m%d.tif')
+                      for par in ['gamma.a', 'gamma.loc', 'gamma.scale', 'normal.loc', 'normal.scale', 'prob0']}
+        return SPI(index_options = {'agg_fn': {'1': agg.sum_of_window(1, 'months')},
+                                    'distribution': {'g': 'gamma', 'n': 'normal'}},
+                   io_options = {'data_raw': self.raw,
+                                 'data':  LocalIOHandler(path = os.path.join(out, 'data'), file = 'd{agg_fn}_%Y%m%d.tif'),
+                                 **parameters,
+                                 'log':   LocalIOHandler(path = out, file = 'log.txt'),
+                                 'index': LocalIOHandler(path = os.path.join(out, 'maps'), file = 'spi{agg_fn}{distribution}_%Y%m%d.tif')})
+
+    def test_parallel_same_as_sequential(self):
+        distr_par = {distr: list(pars) for distr, pars in SPI.distr_par.items()}
+        current, reference = (datetime(2019, 1, 1), datetime(2019, 12, 31)), (datetime(2010, 1, 1), datetime(2018, 12, 31))
+
+        sequential = self.make_spi('sequential')
+        sequential.parallel_index = False
+        sequential.compute(current = current, reference = reference, timesteps_per_year = 12)
+
+        parallel = self.make_spi('parallel')
+        parallel.parallel_index = True
+        parallel.max_workers = 4
+        parallel.compute(current = current, reference = reference, timesteps_per_year = 12)
+
+        # calc_index must not change the parameters listed for each distribution
+        self.assertEqual(SPI.distr_par, distr_par)
+
+        for distribution in ['g', 'n']:
+            seq_index = sequential._index.update(agg_fn = '1', distribution = distribution)
+            par_index = parallel._index.update(agg_fn = '1', distribution = distribution)
+            times = seq_index.get_times(TimeRange(*current))
+            self.assertEqual(len(times), 12)
+            self.assertEqual(par_index.get_times(TimeRange(*current)), times)
+            for time in times:
+                np.testing.assert_array_equal(par_index.get_data(time).values, seq_index.get_data(time).values)
+
+if __name__ == '__main__':
+    unittest.main()
@@ -1,11 +1,18 @@
 import unittest
 from unittest.mock import patch
+import tempfile
+import os
+import shutil
 
 import numpy as np
 import xarray as xr
-from datetime import datetime
+import rioxarray
+from datetime import datetime, timedelta
 
 from dryes.io import LocalIOHandler
+from dryes.io import local_handler
+from dryes.io.local_handler import read_raster
+from dryes.utils.time import TimeRange
 
 def make_sample_data():
     # Create a 10x10 array with values from 0 to 99
@@ -71,6 +78,165 @@ class TestLocalIOHandler(unittest.TestCase):
         mock_exists.assert_called_once_with('path/file_20210101.tif')
         mock_open_rasterio.assert_called_once_with('path/file_20210101.tif')
 
-    
+    def test_zarr(self):
+        with tempfile.TemporaryDirectory() as tmpdir:
+            handler = LocalIOHandler(path=tmpdir, file='data.zarr', name = 'test')
+            self.assertEqual(handler.format, 'Zarr')
+            handler.template = handler.make_template_from_data(self.sample_data)
+
+            # write out of order, then overwrite an existing time
+            times = [datetime(2021, 1, 3), datetime(2021, 1, 1)]
+            for i, time in enumerate(times):
+                handler.write_data(np.full((10, 10), i), time)
+            handler.write_data(np.full((10, 10), 5), times[0])
+
+            self.assertTrue(handler.check_data(times[1]))
+            self.assertFalse(handler.check_data(datetime(2021, 1, 2)))
+            self.assertEqual(handler.get_times(TimeRange(datetime(2021, 1, 1), datetime(2021, 1, 31))), sorted(times))
+
+            data = handler.get_data(times[0])
+            self.assertTrue(np.all(data.values == 5))
+            self.assertIsNotNone(data.rio.crs)
+
+            # several times at once, one of them already in the store
+            batch_times = [datetime(2021, 1, 1), datetime(2021, 1, 4), datetime(2021, 1, 5)]
+            handler.write_batch([np.full((10, 10), 10 + i) for i in range(3)], batch_times)
+            self.assertEqual(handler.get_times(TimeRange(datetime(2021, 1, 1), datetime(2021, 1, 31))),
+                             sorted(set(times + batch_times)))
+            self.assertTrue(np.all(handler.get_data(batch_times[0]).values == 10))
+            self.assertTrue(np.all(handler.get_data(batch_times[2]).values == 12))
+
+    def test_get_data_after_overwrite(self):
+        with tempfile.TemporaryDirectory() as tmpdir:
+            time = datetime(2021, 1, 1)
+            for file in ['data.zarr', 'file_%Y%m%d.tif']:
+                handler = LocalIOHandler(path=tmpdir, file=file, name = 'test')
+                handler.template = handler.make_template_from_data(self.sample_data)
+                handler.write_data(np.zeros((10, 10)), time)
+                handler.write_data(np.zeros((10, 10)), datetime(2021, 1, 2))
+                reader = handler.update()
+                self.assertTrue(np.all(handler.get_data(time).values == 0))
+                self.assertTrue(np.all(reader.get_data(time).values == 0))
+
+                # the cached reads are not used after the data is overwritten (in a region of the zarr store),
+                # by the same handler or by another one
+                handler.write_data(np.full((10, 10), 5.), time)
+                self.assertTrue(np.all(handler.get_data(time).values == 5))
+                self.assertTrue(np.all(reader.get_data(time).values == 5))
+                reader.write_data(np.full((10, 10), 6.), time)
+                self.assertTrue(np.all(handler.get_data(time).values == 6))
+
+    def test_zarr_times_external_append(self):
+        with tempfile.TemporaryDirectory() as tmpdir:
+            handler = LocalIOHandler(path=tmpdir, file='data.zarr', name = 'test')
+            handler.template = handler.make_template_from_data(self.sample_data)
+            time_range = TimeRange(datetime(2021, 1, 1), datetime(2021, 1, 31))
+            handler.write_data(np.zeros((10, 10)), datetime(2021, 1, 1))
+            self.assertEqual(handler.get_times(time_range), [datetime(2021, 1, 1)])
+
+            # a time appended by someone else is seen
+            store = handler.path()
+            appended = self.sample_data.expand_dims(time = [datetime(2021, 1, 2)]).to_dataset(name = 'test')
+            appended.drop_vars('spatial_ref').to_zarr(store, append_dim = 'time', consolidated = False)
+            self.assertEqual(handler.get_times(time_range), [datetime(2021, 1, 1), datetime(2021, 1, 2)])
+
+    def test_zarr_times_cache_size(self):
+        with tempfile.TemporaryDirectory() as tmpdir:
+            handler = LocalIOHandler(path=tmpdir, file='data_{tag}.zarr', name = 'test')
+            handler.template = handler.make_template_from_data(self.sample_data)
+            stores = []
+            for i in range(5):
+                handler.write_data(np.zeros((10, 10)), datetime(2021, 1, 1), tag = i)
+                stores.append(handler.path(tag = i))
+
+            with patch('dryes.io.local_handler._zarr_times_cache_size', 2):
+                for store in stores:
+                    self.assertEqual(local_handler.get_zarr_times(store), [datetime(2021, 1, 1)])
+                self.assertLessEqual(len(local_handler._zarr_times_cache), 2)
+                self.assertIn(stores[-1], local_handler._zarr_times_cache)
+
+    def test_get_times_nested_dirs(self):
+        with tempfile.TemporaryDirectory() as tmpdir:
+            handler = LocalIOHandler(path=tmpdir + '/%Y/%m', file='file_%Y%m%d.tif', name = 'test')
+            handler.template = handler.make_template_from_data(self.sample_data)
+            time_range = TimeRange(datetime(2021, 1, 1), datetime(2021, 3, 31))
+
+            handler.write_data(np.zeros((10, 10)), datetime(2021, 1, 5))
+            self.assertEqual(handler.get_times(time_range), [datetime(2021, 1, 5)])
+
+            # files written by someone else, in an existing and in a new subdirectory, are seen too
+            self.sample_data.rio.to_raster(f'{tmpdir}/2021/01/file_20210107.tif')
+            os.makedirs(f'{tmpdir}/2021/03')
+            self.sample_data.rio.to_raster(f'{tmpdir}/2021/03/file_20210301.tif')
+            self.assertEqual(handler.get_times(time_range), [datetime(2021, 1, 5), datetime(2021, 1, 7), datetime(2021, 3, 1)])
+
+    def test_write_to_removed_dir(self):
+        with tempfile.TemporaryDirectory() as tmpdir:
+            handler = LocalIOHandler(path=tmpdir + '/out/%Y', file='file_%Y%m%d.tif', name = 'test')
+            handler.template = handler.make_template_from_data(self.sample_data)
+            handler.write_data(np.zeros((10, 10)), datetime(2021, 1, 1))
+
+            # the directories are created again if they were removed in the meantime
+            shutil.rmtree(tmpdir + '/out')
+            handler.write_data(np.zeros((10, 10)), datetime(2021, 1, 2))
+            self.assertTrue(os.path.exists(tmpdir + '/out/2021/file_20210102.tif'))
+
+    def test_get_times_same_tick(self):
+        with tempfile.TemporaryDirectory() as tmpdir:
+            handler = LocalIOHandler(path=tmpdir, file='file_%Y%m%d.tif', name = 'test')
+            time_range = TimeRange(datetime(2021, 1, 1), datetime(2021, 1, 31))
+            self.sample_data.rio.to_raster(f'{tmpdir}/file_20210101.tif')
+            self.assertEqual(handler.get_times(time_range), [datetime(2021, 1, 1)])
+
+            # a file written by someone else right after the listing, within the resolution of the modification times
+            dir_mtime = os.stat(tmpdir).st_mtime_ns
+            self.sample_data.rio.to_raster(f'{tmpdir}/file_20210102.tif')
+            os.utime(tmpdir, ns = (dir_mtime, dir_mtime))
+            self.assertEqual(handler.get_times(time_range), [datetime(2021, 1, 1), datetime(2021, 1, 2)])
+
+            # once the directory has not changed for a while, the listing is reused
+            old_mtime = dir_mtime - 3600 * 10**9
+            os.utime(tmpdir, ns = (old_mtime, old_mtime))
+            handler.get_times(time_range)
+            with patch('os.listdir', wraps = os.listdir) as mock_listdir:
+                self.assertEqual(handler.get_times(time_range), [datetime(2021, 1, 1), datetime(2021, 1, 2)])
+                mock_listdir.assert_not_called()
+
+    def test_read_raster_cache(self):
+        with tempfile.TemporaryDirectory() as tmpdir:
+            handler = LocalIOHandler(path=tmpdir, file='file_{tag}_%Y%m%d.tif', name = 'test')
+            handler.template = handler.make_template_from_data(self.sample_data)
+            time = datetime(2021, 1, 1)
+            handler.write_data(np.zeros((10, 10)), time, tag = 'a')
+
+            # handlers that resolve to the same file share the read
+            with patch('rioxarray.open_rasterio', wraps = rioxarray.open_rasterio) as mock_open_rasterio:
+                self.assertTrue(np.all(handler.update(tag = 'a').get_data(time).values == 0))
+                self.assertTrue(np.all(handler.update(tag = 'a').get_data(time).values == 0))
+                self.assertEqual(mock_open_rasterio.call_count, 1)
+
+            # writing through a handler drops the cached read
+            handler.write_data(np.ones((10, 10)), time, tag = 'a')
+            self.assertTrue(np.all(handler.update(tag = 'a').get_data(time).values == 1))
+
+            # so does a change to the file on disk
+            path = handler.path(time, tag = 'a')
+            self.sample_data.rio.to_raster(path)
+            self.assertTrue(handler.update(tag = 'a').get_data(time).equals(rioxarray.open_rasterio(path)))
+
+    def test_read_raster_cache_size(self):
+        with tempfile.TemporaryDirectory() as tmpdir:
+            handler = LocalIOHandler(path=tmpdir, file='file_%Y%m%d.tif', name = 'test')
+            handler.template = handler.make_template_from_data(self.sample_data)
+            times = [datetime(2021, 1, 1) + timedelta(days = i) for i in range(5)]
+            for time in times:
+                handler.write_data(np.zeros((10, 10)), time)
+
+            with patch('dryes.io.local_handler._raster_cache_size', 2):
+                for time in times:
+                    read_raster(handler.path(time))
+                self.assertLessEqual(len(local_handler._raster_cache), 2)
+                self.assertIn(handler.path(times[-1]), local_handler._raster_cache)
+
 if __name__ == '__main__':
     unittest.main()
\ No newline at end of file
@@ -0,0 +1,62 @@
+import unittest
+import tempfile
+import os
+
+import numpy as np
+import xarray as xr
+from datetime import datetime, timedelta
+
+from dryes.io import LocalIOHandler
+from dryes.time_aggregation import aggregation_functions as agg
+from dryes.utils.time import create_timesteps, get_window
+
+class TestRollingWindow(unittest.TestCase):
+    def setUp(self):
+        self.tmpdir = tempfile.TemporaryDirectory()
+        self.variable = LocalIOHandler(path = self.tmpdir.name, file = 'data_%Y%m%d.tif', name = 'test')
+
+        # daily data, with some NaNs
+        rng = np.random.default_rng(0)
+        coords = {"x": np.linspace(-50, 40, 10), "y": np.linspace(50, -40, 10)}
+        template = xr.DataArray(np.zeros((10, 10), dtype = np.float32), coords = coords, dims = ["y", "x"])
+        template.rio.set_spatial_dims(x_dim = "x", y_dim = "y", inplace = True)
+        template.rio.write_crs("EPSG:4326", inplace = True)
+        self.variable.template = template
+        for i in range(120):
+            data = rng.gamma(2, 3, size = (10, 10)).astype(np.float32)
+            data[rng.random((10, 10)) < 0.05] = np.nan
+            self.variable.write_data(data, time = datetime(2020, 1, 1) + timedelta(days = i))
+
+    def tearDown(self):
+        self.tmpdir.cleanup()
+
+    def test_same_as_single_timesteps(self):
+        times = list(create_timesteps(datetime(2020, 1, 1), datetime(2020, 4, 29), 36))
+        for agg_function in [agg.sum_of_window(1, 'months'), agg.average_of_window(2, 'months')]:
+            for time, data in agg_function.rolling(self.variable, times):
+                expected = agg_function(self.variable, time)
+                if expected is None:
+                    self.assertIsNone(data)
+                else:
+                    self.assertEqual(data.dtype, expected.dtype)
+                    np.testing.assert_allclose(data, expected, rtol = 1e-5)
+
+    def test_gap_in_data(self):
+        # no data from the 10th of February to the end of March
+        for i in range(40, 90):
+            os.remove(self.variable.path(datetime(2020, 1, 1) + timedelta(days = i)))
+        self.assertEqual(len(self.variable.get_times(get_window(datetime(2020, 3, 31), 1, 'months'))), 0)
+
+        # the gap comes after some data, or it is at the start
+        for start in [datetime(2020, 1, 1), datetime(2020, 3, 20)]:
+            times = list(create_timesteps(start, datetime(2020, 4, 29), 36))
+            for agg_function in [agg.sum_of_window(1, 'months'), agg.average_of_window(1, 'months')]:
+                for time, data in agg_function.rolling(self.variable, times):
+                    expected = agg_function(self.variable, time)
+                    if expected is None:
+                        self.assertIsNone(data)
+                    else:
+                        np.testing.assert_allclose(data, expected, rtol = 1e-5)
+
+if __name__ == '__main__':
+    unittest.main()
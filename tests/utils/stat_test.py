@@ -0,0 +1,36 @@
+import unittest
+import warnings
+
+import numpy as np
+
+from dryes.utils.stat import compute_distr_parameters, compute_distr_parameters_array
+
+def make_sample_data():
+    # 30 years of data on a 1x10x10 grid, with some zeros and some NaNs
+    rng = np.random.default_rng(42)
+    data = rng.gamma(2, 3, size = (30, 1, 10, 10)).astype(np.float32)
+    data[rng.random(data.shape) < 0.2] = 0
+    data[:, 0, 0, :] = np.nan
+    data[5, 0, 1, :] = np.nan
+    data[:26, 0, 2, :] = 0
+    return data
+
+class TestComputeDistrParameters(unittest.TestCase):
+    def setUp(self):
+        self.sample_data = make_sample_data()
+
+    def test_same_as_single_pixel(self):
+        for distribution in ['gamma', 'normal', 'pearson3']:
+            for positive_only in [True, False]:
+                with warnings.catch_warnings():
+                    warnings.simplefilter("ignore", category=RuntimeWarning)
+                    expected = np.apply_along_axis(compute_distr_parameters, axis=0, arr=self.sample_data,
+                                                   distribution=distribution, positive_only=positive_only)
+                    result = compute_distr_parameters_array(self.sample_data, distribution=distribution,
+                                                            positive_only=positive_only)
+
+                self.assertEqual(result.shape, expected.shape)
+                np.testing.assert_allclose(result, expected.astype(float), rtol = 1e-10, atol = 1e-12)
+
+if __name__ == '__main__':
+    unittest.main()
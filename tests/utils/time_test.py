@@ -0,0 +1,52 @@
+import unittest
+import copy
+import pickle
+
+from datetime import datetime
+
+from dryes.utils.time import create_timesteps, TimeRange
+
+class TestCreateTimesteps(unittest.TestCase):
+
+    def test_intervals(self):
+        timesteps = create_timesteps(datetime(2020, 2, 10), datetime(2021, 1, 1), 36)
+        self.assertEqual(timesteps[0], datetime(2020, 2, 11))
+        self.assertEqual(timesteps[-1], datetime(2021, 1, 1))
+        self.assertEqual(len(timesteps), 33)
+
+        timesteps = create_timesteps(datetime(2020, 1, 1), datetime(2021, 12, 31), 4)
+        self.assertEqual(timesteps, tuple(datetime(year, month, 1) for year in [2020, 2021] for month in [1, 4, 7, 10]))
+
+    def test_daily(self):
+        # 29 February is skipped, unless it is the first timestep
+        timesteps = create_timesteps(datetime(2020, 2, 27), datetime(2020, 3, 2), 365)
+        self.assertEqual(timesteps, (datetime(2020, 2, 27), datetime(2020, 2, 28), datetime(2020, 3, 1), datetime(2020, 3, 2)))
+
+        timesteps = create_timesteps(datetime(2020, 2, 29), datetime(2020, 3, 1), 365)
+        self.assertEqual(timesteps, (datetime(2020, 2, 29), datetime(2020, 3, 1)))
+
+    def test_invalid(self):
+        with self.assertRaises(ValueError):
+            create_timesteps(datetime(2020, 1, 1), datetime(2020, 12, 31), 5)
+
+class TestTimeRange(unittest.TestCase):
+
+    def test_immutable(self):
+        time_range = TimeRange(datetime(2020, 1, 1), datetime(2020, 12, 31))
+        cache = {time_range: 'value'}
+        with self.assertRaises(AttributeError):
+            time_range.start = datetime(2019, 1, 1)
+        with self.assertRaises(AttributeError):
+            time_range.end = datetime(2021, 1, 1)
+        with self.assertRaises(AttributeError):
+            del time_range.start
+        self.assertEqual(cache[TimeRange(datetime(2020, 1, 1), datetime(2020, 12, 31))], 'value')
+
+    def test_copy(self):
+        time_range = TimeRange(datetime(2020, 1, 1), datetime(2020, 12, 31))
+        for other in [copy.copy(time_range), copy.deepcopy(time_range), pickle.loads(pickle.dumps(time_range))]:
+            self.assertEqual(other, time_range)
+            self.assertEqual(hash(other), hash(time_range))
+
+if __name__ == '__main__':
+    unittest.main()